@@ -9,6 +9,7 @@ layer for a driver that gets positions and returns forces (and energy).
 # See the "licenses" directory for full license information.
 
 
+import sys
 import time
 import threading
 
@@ -30,6 +31,11 @@ try:
 except:
     plumed = None
 
+try:
+    from scipy.linalg.blas import dsymv, dgemv, sgemv
+except ImportError:
+    dsymv = dgemv = sgemv = None
+
 import os
 
 class ForceRequest(dict):
@@ -40,12 +46,146 @@ class ForceRequest(dict):
     Standard dicts are checked for equality if elements have the same value.
     Here I only care if requests are instances of the very same object.
     This is useful for the `in` operator, which uses equality to test membership.
+
+    Requests also carry an event that is set as soon as their status becomes
+    "Done" or "Exit", so that the threads waiting for the result can block on
+    it rather than polling the status.
     """
 
+    def __init__(self, *args, **kwargs):
+        """Initialises the request and its completion event."""
+
+        super(ForceRequest, self).__init__(*args, **kwargs)
+        self._done = threading.Event()
+        if self.get("status") in ("Done", "Exit"):
+            self._done.set()
+
     def __eq__(self, y):
         """Overwrites the standard equals function."""
         return self is y
 
+    def __setitem__(self, key, value):
+        """Sets an item, signaling the completion of the request."""
+
+        dict.__setitem__(self, key, value)
+        if key == "status" and (value == "Done" or value == "Exit"):
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Blocks until the request is completed, or until timeout seconds
+        have passed. Returns True if the request has been completed."""
+
+        return self._done.wait(timeout)
+
+
+class RequestQueue(object):
+    """Container for the requests that are pending on a forcefield.
+
+    The same object is shared by a forcefield and, when there is one, the
+    socket interface that serves its requests, so that both always see the
+    same pending jobs. Appending a request wakes up the polling loop.
+
+    Attributes:
+        lock: The lock protecting the queue, shared with the forcefield.
+        _queue: A dict holding the requests, keyed by their id(), so that
+            they can be released in any order at constant cost. Insertion
+            order is preserved, so requests are served first come, first
+            served.
+        _queued: A dict holding the requests that might still be waiting to
+            be dispatched, so that finding them does not require scanning
+            the requests that are already running or done.
+        _cv: Condition built on lock, used to wake up the polling loop as
+            soon as a new request is queued.
+        _pending: True if requests were queued since the polling loop last
+            woke up.
+    """
+
+    def __init__(self, lock=None):
+        """Initialises RequestQueue.
+
+        Args:
+            lock: An optional lock to be used to protect the queue. A new one
+                is created if none is given.
+        """
+
+        self.lock = threading.Lock() if lock is None else lock
+        self._queue = {}
+        self._queued = {}
+        self._cv = threading.Condition(self.lock)
+        self._pending = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __contains__(self, request):
+        return self._queue.get(id(request)) is request
+
+    def __iter__(self):
+        """Iterates over a snapshot of the queue, so that requests can be
+        added or released by other threads in the meantime."""
+
+        return iter(list(self._queue.values()))
+
+    def append(self, request):
+        """Adds a request to the queue and wakes up the polling loop."""
+
+        self.extend((request,))
+
+    def extend(self, requests):
+        """Adds several requests to the queue and wakes up the polling loop."""
+
+        with self._cv:
+            for request in requests:
+                self._queue[id(request)] = request
+                self._queued[id(request)] = request
+            self._pending = True
+            self._cv.notify()
+
+    def remove(self, request):
+        """Removes a request from the queue, if it is still there."""
+
+        with self.lock:
+            if self._queue.get(id(request)) is request:
+                del self._queue[id(request)]
+                self._queued.pop(id(request), None)
+
+    def queued(self):
+        """Returns the list of the requests that are waiting to be dispatched.
+
+        Requests only leave the "Queued" status moving forward, unless they
+        are explicitly put back with requeue, so the ones that have been
+        dispatched are dropped from the index as they are found.
+        """
+
+        queued = []
+        for key, request in list(self._queued.items()):
+            if request["status"] == "Queued":
+                queued.append(request)
+            else:
+                self._queued.pop(key, None)
+        return queued
+
+    def requeue(self, request):
+        """Puts back a request whose evaluation was interrupted, e.g. because
+        the client it was assigned to disconnected."""
+
+        request["status"] = "Queued"
+        request["start"] = -1
+        with self._cv:
+            if self._queue.get(id(request)) is request:
+                self._queued[id(request)] = request
+                self._pending = True
+                self._cv.notify()
+
+    def wait(self, timeout):
+        """Waits until a new request is queued, or until timeout seconds have
+        passed, whichever comes first."""
+
+        with self._cv:
+            if not self._pending:
+                self._cv.wait(timeout=timeout)
+            self._pending = False
+
 
 class ForceField(dobject):
 
@@ -60,13 +200,19 @@ class ForceField(dobject):
         name: The name of the forcefield.
         latency: A float giving the number of seconds the socket will wait
             before updating the client list.
-        requests: A list of all the jobs to be given to the client codes.
+        requests: A RequestQueue of all the jobs to be given to the client codes.
         dopbc: A boolean giving whether or not to apply the periodic boundary
             conditions before sending the positions to the client code.
         _thread: The thread on which the socket polling loop is being run.
         _doloop: A list of booleans. Used to decide when to stop running the
             polling loop.
         _threadlock: Python handle used to lock the thread held in _thread.
+            It also protects the requests queue.
+        _iactive: The indices of the active coordinates, built on the first
+            call to queue.
+        _cell: The last (h, ih) tuple sent with the requests.
+        _profile: Whether the requests should be time-stamped, which is only
+            reported at debug verbosity.
     """
 
     def __init__(self, latency=1.0, name="", pars=None, dopbc=True, active=np.array([-1]), threaded=False):
@@ -88,16 +234,100 @@ class ForceField(dobject):
         else:
             self.pars = pars
 
+        # the parameters never change during a run, so the string that is
+        # sent to the drivers is built just once
+        self._par_str = " "
+        for k, v in list(self.pars.items()):
+            self._par_str += k + " : " + str(v) + " , "
+
         self.name = name
         self.latency = latency
-        self.requests = []
+        self._threadlock = threading.Lock()
+        self.requests = RequestQueue(self._threadlock)
         self.dopbc = dopbc
         self.active = active
-        self.iactive = None
+        self._iactive = None
+        self._cell = None
         self.threaded = threaded
         self._thread = None
         self._doloop = [False]
-        self._threadlock = threading.Lock()
+
+        # work arrays reused by the evaluators, see _get_scratch
+        self._f_scratch = None
+        self._vir_scratch = np.zeros((3, 3), float)
+
+        # timings are only reported at debug level, so don't pay for them otherwise
+        self._profile = verbosity.debug
+
+    def _get_scratch(self, n):
+        """Returns zeroed force and virial work arrays.
+
+        The arrays are kept between calls, so that evaluators do not need to
+        allocate new ones at every step. They must be copied before being
+        handed over as the result of a request.
+
+        Args:
+            n: The number of force components needed.
+        """
+
+        if self._f_scratch is None or self._f_scratch.size < n:
+            self._f_scratch = np.zeros(n, float)
+        f = self._f_scratch[:n]
+        f.fill(0.0)
+        self._vir_scratch.fill(0.0)
+        return f, self._vir_scratch
+
+    def _get_iactive(self, npos):
+        """Returns the indices of the active coordinates.
+
+        Indexes come from input in a per atom basis and we need to make a per
+        atom-coordinate basis, for the full system (default) or piece of
+        system. Active atoms do not change, but we only know how to build this
+        array once we get the positions, so it is built on the first call.
+        Concurrent first calls are serialized by the thread lock.
+
+        Args:
+            npos: The number of position components.
+        """
+
+        iactive = self._iactive
+        if iactive is None:
+            with self._threadlock:
+                if self._iactive is None:
+                    if self.active[0] == -1:
+                        activehere = np.arange(npos)
+                    else:
+                        # expands each atom index n into 3n, 3n+1, 3n+2
+                        base = 3 * np.asarray(self.active, dtype=np.int64)
+                        activehere = (base[:, np.newaxis] + np.arange(3)).ravel()
+
+                    # Perform sanity check for active atoms
+                    if (len(activehere) > npos or activehere[-1] > (npos - 1)):
+                        raise ValueError("There are more active atoms than atoms!")
+
+                    self._iactive = activehere
+                iactive = self._iactive
+        return iactive
+
+    def _get_cell(self, cell):
+        """Returns read-only copies of the cell matrix and its inverse.
+
+        The cell is the same for all the beads, and often for the whole
+        simulation, so the copies are shared between requests for as long as
+        the cell does not change.
+
+        Args:
+            cell: A Cell object giving the system box.
+        """
+
+        h = dstrip(cell.h)
+        hih = self._cell
+        if hih is None or not np.array_equal(hih[0], h):
+            hih = (h.copy(), dstrip(cell.ih).copy())
+            hih[0].flags.writeable = False
+            hih[1].flags.writeable = False
+            self._cell = hih
+        return hih
 
     def queue(self, atoms, cell, reqid=-1):
         """Adds a request.
@@ -123,53 +353,36 @@ class ForceField(dobject):
             the starting time for the calculation, used to check for timeouts.}.
         """
 
-        par_str = " "
-
-        if not self.pars is None:
-            for k, v in list(self.pars.items()):
-                par_str += k + " : " + str(v) + " , "
-        else:
-            par_str = " "
-
-        pbcpos = dstrip(atoms.q).copy()
-
-        # Indexes come from input in a per atom basis and we need to make a per atom-coordinate basis
-        # Reformat indexes for full system (default) or piece of system
-        # active atoms do not change but we only know how to build this array once we get the positions once
-        if self.iactive is None:
-            if self.active[0] == -1:
-                activehere = np.arange(len(pbcpos))
-            else:
-                activehere = np.array([[3 * n, 3 * n + 1, 3 * n + 2] for n in self.active])
-
-            # Reassign active indexes in order to use them
-            activehere = activehere.flatten()
-
-            # Perform sanity check for active atoms
-            if (len(activehere) > len(pbcpos) or activehere[-1] > (len(pbcpos) - 1)):
-                raise ValueError("There are more active atoms than atoms!")
-
-            self.iactive = activehere
+        par_str = self._par_str
 
+        # positions are only copied when they need to be folded back into
+        # the cell, otherwise a read-only view is handed over to the driver
+        pbcpos = dstrip(atoms.q)
         if self.dopbc:
+            pbcpos = pbcpos.copy()
             cell.array_pbc(pbcpos)
+        else:
+            pbcpos = pbcpos.view()
+            pbcpos.flags.writeable = False
+
+        iactive = self._get_iactive(len(pbcpos))
 
         newreq = ForceRequest({
             "id": reqid,
             "pos": pbcpos,
-            "active": self.iactive,
-            "cell": (dstrip(cell.h).copy(), dstrip(cell.ih).copy()),
+            "active": iactive,
+            "cell": self._get_cell(cell),
             "pars": par_str,
             "result": None,
             "status": "Queued",
             "start": -1,
-            "t_queued": time.time(),
+            "profile": self._profile,
+            "t_queued": time.monotonic_ns() if self._profile else 0,
             "t_dispatched": 0,
             "t_finished": 0
         })
 
-        with self._threadlock:
-            self.requests.append(newreq)
+        self.requests.append(newreq)
 
         if not self.threaded:
             self.poll()
@@ -180,23 +393,26 @@ class ForceField(dobject):
         """Polls the forcefield object to check if it has finished."""
 
         with self._threadlock:
-            for r in self.requests:
+            for r in self.requests.queued():
                 if r["status"] == "Queued":
-                    r["t_dispatched"] = time.time()
+                    if self._profile:
+                        r["t_dispatched"] = time.monotonic_ns()
                     r["result"] = [0.0, np.zeros(len(r["pos"]), float), np.zeros((3, 3), float), ""]
                     r["status"] = "Done"
-                    r["t_finished"] = time.time()
+                    if self._profile:
+                        r["t_finished"] = time.monotonic_ns()
 
     def _poll_loop(self):
         """Polling loop.
 
         Loops over the different requests, checking to see when they have
-        finished.
+        finished. The loop wakes up every latency seconds, or as soon as a
+        new request is queued.
         """
 
         info(" @ForceField: Starting the polling thread main loop.", verbosity.low)
         while self._doloop[0]:
-            time.sleep(self.latency)
+            self.requests.wait(self.latency)
             if len(self.requests) > 0:
                 self.poll()
 
@@ -209,14 +425,7 @@ class ForceField(dobject):
 
         """Frees up a request."""
 
-        with self._threadlock:
-            if request in self.requests:
-                try:
-                    self.requests.remove(request)
-                except ValueError:
-                    print("failed removing request", id(request), ' ', end=' ')
-                    print([id(r) for r in self.requests], "@", threading.currentThread())
-                    raise
+        self.requests.remove(request)
 
     def stop(self):
         """Dummy stop method."""
@@ -320,8 +529,16 @@ class FFLennardJones(ForceField):
 
     """Basic fully pythonic force provider.
 
-    Computes LJ interactions without minimum image convention, cutoffs or
-    neighbour lists. Parallel evaluation with threads.
+    Computes LJ interactions without minimum image convention. By default
+    there is no cutoff and all pairs are computed; if a cutoff radius 'rc' is
+    given among the parameters, interactions are truncated sharply at rc and
+    the pairs are found with a cell list, so that the cost grows linearly with
+    the number of atoms. Parallel evaluation with threads.
+
+    Without a cutoff the pairs are evaluated as arrays holding at most
+    _max_pairs pairs at once: below that the pair indices are built once and
+    kept, above it the pairs are split in blocks of rows, so that memory
+    stays bounded for large systems.
 
     Attributes:
         parameters: A dictionary of the parameters used by the driver. Of the
@@ -333,6 +550,9 @@ class FFLennardJones(ForceField):
                          'start': starting time}.
     """
 
+    # the largest number of pairs held in memory at once
+    _max_pairs = 2**20
+
     def __init__(self, latency=1.0e-3, name="", pars=None, dopbc=False, threaded=False):
         """Initialises FFLennardJones.
 
@@ -350,6 +570,19 @@ class FFLennardJones(ForceField):
         self.sixepsfour = 6 * self.epsfour
         self.sigma2 = float(self.pars["sigma"]) * float(self.pars["sigma"])
 
+        if "rc" in self.pars:
+            self.rc = float(self.pars["rc"])
+            if self.rc <= 0:
+                raise ValueError("The cutoff radius of FFLennardJones must be positive.")
+        else:
+            self.rc = None
+
+        # indices of the i < j pairs, built on the first call for small systems
+        self._pairs = None
+
+        # offsets to the neighbouring cells, used when there is a cutoff
+        self._cell_offsets = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)])
+
     def poll(self):
         """Polls the forcefield checking if there are requests that should
         be answered, and if necessary evaluates the associated forces and energy."""
@@ -357,37 +590,137 @@ class FFLennardJones(ForceField):
         # We have to be thread-safe, as in multi-system mode this might get
         # called by many threads at once.
         with self._threadlock:
-            for r in self.requests:
+            for r in self.requests.queued():
                 if r["status"] == "Queued":
                     r["status"] = "Running"
-                    r["t_dispatched"] = time.time()
+                    if self._profile:
+                        r["t_dispatched"] = time.monotonic_ns()
                     self.evaluate(r)
 
+    def _cell_list_pairs(self, q):
+        """Finds the i < j pairs closer than the cutoff radius.
+
+        Atoms are binned in cubic cells with side rc, so that only the atoms
+        in the same or in adjacent cells need to be checked.
+
+        Args:
+            q: A (nat, 3) array with the atomic positions.
+
+        Returns:
+            The arrays of the i and j indices of the pairs.
+        """
+
+        nat = len(q)
+        ic = np.floor((q - q.min(axis=0)) / self.rc).astype(np.int64)
+        nc = ic.max(axis=0) + 1
+        cid = (ic[:, 0] * nc[1] + ic[:, 1]) * nc[2] + ic[:, 2]
+
+        # atoms sorted by cell, and the position of each cell in that list.
+        # only the occupied cells are stored, as without PBC a few distant
+        # atoms can make the bounding box hold a huge number of empty cells
+        ucid, inv = np.unique(cid, return_inverse=True)
+        order = np.argsort(inv, kind="stable")
+        counts = np.bincount(inv)
+        starts = np.cumsum(counts) - counts
+
+        ilist, jlist = [], []
+        for off in self._cell_offsets:
+            jc = ic + off
+            ok = np.all((jc >= 0) & (jc < nc), axis=1)
+            iat = np.nonzero(ok)[0]
+            jc = jc[ok]
+            jcid = (jc[:, 0] * nc[1] + jc[:, 1]) * nc[2] + jc[:, 2]
+
+            # looks up the neighbouring cell among the occupied ones
+            jk = np.minimum(np.searchsorted(ucid, jcid), len(ucid) - 1)
+            found = ucid[jk] == jcid
+            iat = iat[found]
+            jk = jk[found]
+
+            # pairs every atom with all the atoms in the neighbouring cell
+            nj = counts[jk]
+            ntot = nj.sum()
+            if ntot == 0:
+                continue
+            first = np.repeat(np.cumsum(nj) - nj, nj)
+            jat = order[np.repeat(starts[jk], nj) + np.arange(ntot) - first]
+            iat = np.repeat(iat, nj)
+
+            keep = iat < jat
+            ilist.append(iat[keep])
+            jlist.append(jat[keep])
+
+        if len(ilist) == 0:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        iu = np.concatenate(ilist)
+        ju = np.concatenate(jlist)
+        dq = q[iu] - q[ju]
+        close = np.einsum("pk,pk->p", dq, dq) < self.rc * self.rc
+        return iu[close], ju[close]
+
     def evaluate(self, r):
-        """Just a silly function evaluating a non-cutoffed, non-pbc and
-        non-neighbour list LJ potential."""
+        """Just a silly function evaluating a non-pbc LJ potential, either
+        over all pairs or with a sharp cutoff."""
 
         q = r["pos"].reshape((-1, 3))
         nat = len(q)
+        f = np.zeros((nat, 3), float)
+
+        # each pair is only visited once, and the force on j is obtained
+        # from Newton's third law
+        if self.rc is not None:
+            v = self._pair_forces(q, *self._cell_list_pairs(q), f=f)
+        elif nat * (nat - 1) // 2 <= self._max_pairs:
+            if self._pairs is None or self._pairs[0] != nat:
+                self._pairs = (nat,) + np.triu_indices(nat, k=1)
+            v = self._pair_forces(q, *self._pairs[1:], f=f)
+        else:
+            v = 0.0
+            nrow = max(1, self._max_pairs // nat)
+            for i0 in range(0, nat - 1, nrow):
+                rows = np.arange(i0, min(i0 + nrow, nat - 1))
+                iu, ju = np.nonzero(np.arange(nat) > rows[:, np.newaxis])
+                v += self._pair_forces(q, iu + i0, ju, f=f)
+
+        r["result"] = [v, f.reshape(nat * 3), np.zeros((3, 3), float), ""]
+        r["status"] = "Done"
+
+    def _pair_forces(self, q, iu, ju, f):
+        """Evaluates the LJ interactions of a list of pairs.
+
+        Args:
+            q: A (nat, 3) array with the atomic positions.
+            iu, ju: The arrays of the i and j indices of the pairs.
+            f: A (nat, 3) array to which the forces are added.
+
+        Returns:
+            The potential energy of the pairs.
+        """
+
+        nat = len(q)
+        dq = q[iu] - q[ju]
+        rij2 = np.einsum("pk,pk->p", dq, dq)
 
-        v = 0.0
-        f = np.zeros(q.shape)
-        for i in range(1, nat):
-            dij = q[i] - q[:i]
-            rij2 = (dij**2).sum(axis=1)
+        # works in place as much as possible to limit the number of temporaries
+        x6 = np.divide(self.sigma2, rij2)
+        np.power(x6, 3, out=x6)
+        x12 = x6 * x6
 
-            x6 = (self.sigma2 / rij2)**3
-            x12 = x6**2
+        v = self.epsfour * (x12.sum() - x6.sum())
 
-            v += (x12 - x6).sum()
-            dij *= (self.sixepsfour * (2.0 * x12 - x6) / rij2)[:, np.newaxis]
-            f[i] += dij.sum(axis=0)
-            f[:i] -= dij
+        # turns x12 into the pair force prefactor
+        x12 *= 2.0
+        x12 -= x6
+        x12 *= self.sixepsfour
+        x12 /= rij2
+        dq *= x12[:, np.newaxis]
 
-        v *= self.epsfour
+        # scatters the pair forces on the atoms
+        for k in range(3):
+            f[:, k] += np.bincount(iu, dq[:, k], nat)
+            f[:, k] -= np.bincount(ju, dq[:, k], nat)
 
-        r["result"] = [v, f.reshape(nat * 3), np.zeros((3, 3), float), ""]
-        r["status"] = "Done"
+        return v
 
 
 class FFDebye(ForceField):
@@ -426,36 +759,105 @@ class FFDebye(ForceField):
         self.xref = xref
         self.vref = vref
 
-        eigsys = np.linalg.eigh(self.H)
-        info(" @ForceField: Hamiltonian eigenvalues: " + ' '.join(map(str, eigsys[0])), verbosity.medium)
+        w, Q = np.linalg.eigh(self.H)
+        info(" @ForceField: Hamiltonian eigenvalues: " + ' '.join(map(str, w)), verbosity.medium)
+
+        # keeps the eigensystem restricted to the modes with a non-zero
+        # frequency. when there are few of them (e.g. when most of the system
+        # is decoupled) the potential is evaluated in the eigenbasis, which
+        # costs O(N k) rather than O(N^2)
+        nonzero = np.abs(w) > np.abs(w).max() * len(w) * np.finfo(float).eps
+        self._w = w[nonzero]
+        self._Q = np.ascontiguousarray(Q[:, nonzero])
+        self._Qt_xref = np.dot(self._Q.T, self.xref)
+        self._use_modes = 2 * len(self._w) < len(w)
+
+        # the Hessian is symmetric, so when scipy is available the product is
+        # done with a symmetric BLAS kernel, that only reads half of it.
+        # the transpose of a C-ordered H is already in Fortran order.
+        if dsymv is not None and not self._use_modes:
+            self._H_f = np.asfortranarray(np.asarray(self.H, dtype=float).T)
 
     def poll(self):
         """ Polls the forcefield checking if there are requests that should
         be answered, and if necessary evaluates the associated forces and energy. """
 
-        # we have to be thread-safe, as in multi-system mode this might get called by many threads at once
+        # we have to be thread-safe, as in multi-system mode this might get
+        # called by many threads at once. only picking up the requests needs
+        # the lock: the evaluation does not modify the forcefield, and the
+        # BLAS calls release the GIL, so different threads can overlap
         with self._threadlock:
-            for r in self.requests:
-                if r["status"] == "Queued":
-                    r["status"] = "Running"
-                    self.evaluate(r)
+            queued = [r for r in self.requests.queued() if r["status"] == "Queued"]
+            for r in queued:
+                r["status"] = "Running"
+                if self._profile:
+                    r["t_dispatched"] = time.monotonic_ns()
 
-    def evaluate(self, r):
-        """ A simple evaluator for a harmonic Debye crystal potential. """
+        # several beads are evaluated at once as a matrix-matrix product
+        if len(queued) == 1:
+            self.evaluate(queued[0])
+        elif len(queued) > 1:
+            self.evaluate_batch(queued)
+
+    def _check_size(self, q):
+        """ Checks that the positions are compatible with the potential. """
 
-        q = r["pos"]
         n3 = len(q)
         if self.H.shape != (n3, n3):
             raise ValueError("Hessian size mismatch")
         if self.xref.shape != (n3,):
             raise ValueError("Reference structure size mismatch")
 
-        d = q - self.xref
-        mf = np.dot(self.H, d)
+    def evaluate_batch(self, rs):
+        """ Evaluates the harmonic Debye crystal potential for a list of
+        requests at once. """
+
+        for r in rs:
+            self._check_size(r["pos"])
+
+        qs = np.stack([r["pos"] for r in rs])
+        if self._use_modes:
+            y = np.dot(qs, self._Q)
+            y -= self._Qt_xref
+            wy = self._w * y
+            vs = self.vref + 0.5 * np.einsum("bi,bi->b", y, wy)
+            mfs = np.dot(wy, self._Q.T)
+        else:
+            # H is symmetric, so D H = (H D^T)^T
+            ds = qs - self.xref
+            mfs = np.dot(ds, self.H)
+            vs = self.vref + 0.5 * np.einsum("bi,bi->b", ds, mfs)
+
+        for r, v, mf in zip(rs, vs, mfs):
+            r["result"] = [v, -mf, np.zeros((3, 3), float), ""]
+            r["status"] = "Done"
+            if self._profile:
+                r["t_finished"] = time.monotonic_ns()
+
+    def evaluate(self, r):
+        """ A simple evaluator for a harmonic Debye crystal potential. """
 
-        r["result"] = [self.vref + 0.5 * np.dot(d, mf), -mf, np.zeros((3, 3), float), ""]
+        q = r["pos"]
+        self._check_size(q)
+
+        if self._use_modes:
+            y = np.dot(self._Q.T, q)
+            y -= self._Qt_xref
+            wy = self._w * y
+            v = self.vref + 0.5 * np.dot(y, wy)
+            mf = np.dot(self._Q, wy)
+        else:
+            d = q - self.xref
+            if dsymv is not None:
+                mf = dsymv(1.0, self._H_f, d)
+            else:
+                mf = np.dot(self.H, d)
+            v = self.vref + 0.5 * np.dot(d, mf)
+
+        r["result"] = [v, -mf, np.zeros((3, 3), float), ""]
         r["status"] = "Done"
-        r["t_finished"] = time.time()
+        if self._profile:
+            r["t_finished"] = time.monotonic_ns()
 
 
 class FFPlumed(ForceField):
@@ -498,6 +900,9 @@ class FFPlumed(ForceField):
             mycell.h *= unit_to_internal("length", self.init_file.units, 1.0)
 
         self.natoms = myatoms.natoms
+        # all the arrays exchanged with PLUMED are float64, which is also the
+        # precision PLUMED works in, so no conversion is ever needed
+        self.plumed.cmd("setRealPrecision", 8)
         self.plumed.cmd("setNatoms", self.natoms)
         self.plumed.cmd("setPlumedDat", self.plumeddat)
         self.plumed.cmd("setTimestep", 1.)
@@ -513,6 +918,8 @@ class FFPlumed(ForceField):
         self.charges = dstrip(myatoms.q) * 0.0
         self.masses = dstrip(myatoms.m)
         self.lastq = np.zeros(3 * self.natoms)
+        self._box = np.zeros((3, 3), float)
+        self._bias = np.zeros(1, float)
 
     def poll(self):
         """Polls the forcefield checking if there are requests that should
@@ -521,12 +928,14 @@ class FFPlumed(ForceField):
         # We have to be thread-safe, as in multi-system mode this might get
         # called by many threads at once.
         with self._threadlock:
-            for r in self.requests:
+            for r in self.requests.queued():
                 if r["status"] == "Queued":
                     r["status"] = "Running"
-                    r["t_dispatched"] = time.time()
+                    if self._profile:
+                        r["t_dispatched"] = time.monotonic_ns()
                     self.evaluate(r)
-                    r["t_finished"] = time.time()
+                    if self._profile:
+                        r["t_finished"] = time.monotonic_ns()
 
     def evaluate(self, r):
         """A wrapper function to call the PLUMED evaluation routines
@@ -536,8 +945,7 @@ class FFPlumed(ForceField):
             raise ValueError("Size of atom array changed after initialization of FFPlumed")
 
         v = 0.0
-        f = np.zeros(3 * self.natoms)
-        vir = np.zeros((3, 3))
+        f, vir = self._get_scratch(3 * self.natoms)
 
         self.lastq[:] = r["pos"]
         # for the moment these are set to dummy values taken from an init file.
@@ -548,40 +956,43 @@ class FFPlumed(ForceField):
         self.plumed.cmd("setCharges", self.charges)
         self.plumed.cmd("setMasses", self.masses)
 
-        # these instead are set properly. units conversion is done on the PLUMED side
-        self.plumed.cmd("setBox", r["cell"][0])
-        self.plumed.cmd("setPositions", r["pos"])
+        # units conversion is done on the PLUMED side. the request arrays are
+        # read-only, and the PLUMED wrapper only accepts writeable buffers,
+        # so local copies are passed instead
+        self._box[:] = r["cell"][0]
+        self.plumed.cmd("setBox", self._box)
+        self.plumed.cmd("setPositions", self.lastq)
         self.plumed.cmd("setForces", f)
         self.plumed.cmd("setVirial", vir)
         self.plumed.cmd("prepareCalc");
         self.plumed.cmd("performCalcNoUpdate");
 
-        bias = np.zeros(1, float)
-        self.plumed.cmd("getBias", bias)
-        v = bias[0]
-        vir *= -1
+        self.plumed.cmd("getBias", self._bias)
+        v = self._bias[0]
 
-        r["result"] = [v, f, vir, ""]
+        r["result"] = [v, f.copy(), -vir, ""]
         r["status"] = "Done"
 
     def mtd_update(self, pos, cell):
         """ Makes updates to the potential that only need to be triggered
         upon completion of a time step. """
 
-        self.plumedstep += 1
-        f = np.zeros(3 * self.natoms)
-        vir = np.zeros((3, 3))
-
-        self.plumed.cmd("setStep", self.plumedstep)
-        self.plumed.cmd("setCharges", self.charges)
-        self.plumed.cmd("setMasses", self.masses)
-        self.plumed.cmd("setPositions", pos)
-        self.plumed.cmd("setBox", cell)
-        self.plumed.cmd("setForces", f)
-        self.plumed.cmd("setVirial", vir)
-        self.plumed.cmd("prepareCalc");
-        self.plumed.cmd("performCalcNoUpdate");
-        self.plumed.cmd("update")
+        # the work arrays are shared with evaluate, that may run at the
+        # same time in the polling thread
+        with self._threadlock:
+            self.plumedstep += 1
+            f, vir = self._get_scratch(3 * self.natoms)
+
+            self.plumed.cmd("setStep", self.plumedstep)
+            self.plumed.cmd("setCharges", self.charges)
+            self.plumed.cmd("setMasses", self.masses)
+            self.plumed.cmd("setPositions", pos)
+            self.plumed.cmd("setBox", cell)
+            self.plumed.cmd("setForces", f)
+            self.plumed.cmd("setVirial", vir)
+            self.plumed.cmd("prepareCalc");
+            self.plumed.cmd("performCalcNoUpdate");
+            self.plumed.cmd("update")
 
         return True
 
@@ -645,6 +1056,9 @@ class FFYaff(ForceField):
         self.system = System.from_file(self.yaffsys)
         self.ff = ForceField.generate(self.system, self.yaffpara, rcut=self.rcut, alpha_scale=self.alpha_scale, gcut_scale=self.gcut_scale, skin=self.skin, smooth_ei=self.smooth_ei, reci_ei=self.reci_ei)
 
+        # Yaff wants the cell vectors as rows, in a C-ordered array
+        self._rvecs = np.empty((3, 3), np.float64)
+
         log._active = False
 
     def poll(self):
@@ -653,27 +1067,31 @@ class FFYaff(ForceField):
 
         # we have to be thread-safe, as in multi-system mode this might get called by many threads at once
         with self._threadlock:
-            for r in self.requests:
+            for r in self.requests.queued():
                 if r["status"] == "Queued":
                     r["status"] = "Running"
+                    if self._profile:
+                        r["t_dispatched"] = time.monotonic_ns()
                     self.evaluate(r)
 
     def evaluate(self, r):
         """ Evaluate the energy and forces with the Yaff force field. """
 
         q = r["pos"]
-        nat = len(q) / 3
+        nat = len(q) // 3
         rvecs = r["cell"][0]
 
-        self.ff.update_rvecs(np.ascontiguousarray(rvecs.T, dtype=np.float64))
+        np.copyto(self._rvecs, rvecs.T)
+        self.ff.update_rvecs(self._rvecs)
         self.ff.update_pos(q.reshape((nat, 3)))
-        gpos = np.zeros((nat, 3))
-        vtens = np.zeros((3, 3))
+        gpos, vtens = self._get_scratch(3 * nat)
+        gpos = gpos.reshape((nat, 3))
         e = self.ff.compute(gpos, vtens)
 
         r["result"] = [e, -gpos.ravel(), -vtens, ""]
         r["status"] = "Done"
-        r["t_finished"] = time.time()
+        if self._profile:
+            r["t_finished"] = time.monotonic_ns()
 
 
 class FFsGDML(ForceField):
@@ -684,12 +1102,14 @@ class FFsGDML(ForceField):
      https://github.com/stefanch/sGDML
     """
 
-    def __init__(self, latency=1.0, name="", threaded=False, sGDML_model=None, pars=None, dopbc=False):
+    def __init__(self, latency=1.0, name="", threaded=False, sGDML_model=None, pars=None, dopbc=False, use_torch=False):
         """Initialises FFsGDML
 
         Args:
 
            sGDML_model: Filename contaning the sGDML model
+           use_torch: Whether sGDML should run the predictions through PyTorch,
+               on a GPU when one is available
 
         """
 
@@ -713,6 +1133,7 @@ class FFsGDML(ForceField):
             raise ValueError("Must set PBCs to False.")
 
         self.sGDML_model = sGDML_model
+        self.use_torch = use_torch
 
         # --- Load sGDML model file. ---
         try:
@@ -733,11 +1154,17 @@ class FFsGDML(ForceField):
         self.kcalmol_to_hartree = UnitMap["energy"]['cal/mol'] * 1000.
         self.kcalmolang_to_hartreebohr = self.bohr_to_ang * self.kcalmol_to_hartree
 
+        # buffer for the positions in angstrom, allocated on the first call
+        self._pos_ang = None
+
         # --- Creates predictor ---
-        self.predictor = GDMLPredict(self.model)
+        # the PyTorch predictor keeps the model on the device, so only the
+        # positions and the results are transferred at each step
+        self.predictor = GDMLPredict(self.model, use_torch=self.use_torch)
 
-        info(" @ForceField: Optimizing parallelization settings for sGDML FF." , verbosity.medium)
-        self.predictor.prepare_parallel(n_bulk=1)
+        if not self.use_torch:
+            info(" @ForceField: Optimizing parallelization settings for sGDML FF." , verbosity.medium)
+            self.predictor.prepare_parallel(n_bulk=1)
 
     def poll(self):
         """ Polls the forcefield checking if there are requests that should
@@ -745,19 +1172,29 @@ class FFsGDML(ForceField):
 
         # we have to be thread-safe, as in multi-system mode this might get called by many threads at once
         with self._threadlock:
-            for r in self.requests:
+            for r in self.requests.queued():
                 if r["status"] == "Queued":
                     r["status"] = "Running"
+                    if self._profile:
+                        r["t_dispatched"] = time.monotonic_ns()
                     self.evaluate(r)
 
     def evaluate(self, r):
         """ Evaluate the energy and forces. """
 
-        E, F = self.predictor.predict(r["pos"] * self.bohr_to_ang)
+        q = r["pos"]
+        if self._pos_ang is None or self._pos_ang.shape != q.shape:
+            self._pos_ang = np.empty(q.shape, float)
+        np.multiply(q, self.bohr_to_ang, out=self._pos_ang)
+
+        E, F = self.predictor.predict(self._pos_ang)
 
-        r["result"] = [E[0] * self.kcalmol_to_hartree, F.flatten() * self.kcalmolang_to_hartreebohr, np.zeros((3, 3), float), ""]
+        # F is a fresh array returned by sGDML, so it can be converted in place
+        F *= self.kcalmolang_to_hartreebohr
+        r["result"] = [E[0] * self.kcalmol_to_hartree, F.ravel(), np.zeros((3, 3), float), ""]
         r["status"] = "Done"
-        r["t_finished"] = time.time()
+        if self._profile:
+            r["t_finished"] = time.monotonic_ns()
 
 class FFCavPhSocket(ForceField):
 
@@ -828,7 +1265,7 @@ class PhotonDriverFabryPerot():
     """
     def __init__(self, apply_photon=True, E0=1e-4, omega_c_cminv=3400.0, domega_x_cminv=100.0, 
             domega_y_cminv=100.0, n_mode_x=4, n_mode_y=3, x_grid_1d=np.array([0.1, 0.5, 0.9]), 
-            y_grid_1d=np.array([0.1, 0.5]), ph_constraint="none", ph_rep="loose"):
+            y_grid_1d=np.array([0.1, 0.5]), ph_constraint="none", ph_rep="loose", precision="double"):
 
         """
         Initialise PhotonDriverFabryPerot
@@ -847,6 +1284,8 @@ class PhotonDriverFabryPerot():
             y_grid_1d: array of molecular subsystem grid positions in the y direction
             ph_constraint: string value of possible constraint applied to photons
             ph_rep: loose/dense: if the photon coordinates are stored in 2Nmodes or Nmodes photon "atoms"
+            precision: double/single: the precision of the stored mode functions and of
+                the products with them. All the other quantities are kept in double precision
         """
         self.hartree_to_cminv = 219474.63
         self.apply_photon = apply_photon
@@ -859,6 +1298,17 @@ class PhotonDriverFabryPerot():
         self.x_grid_1d = x_grid_1d # units of Lx
         self.y_grid_1d = y_grid_1d # units of Ly
         self.ph_constraint = ph_constraint
+        # the products with the mode functions call BLAS gemv directly when
+        # scipy is available, skipping the generic dispatch of np.dot
+        if precision == "double":
+            self._f_dtype = np.float64
+            self._gemv = dgemv
+        elif precision == "single":
+            self._f_dtype = np.float32
+            self._gemv = sgemv
+        else:
+            raise ValueError("Unknown precision '%s' for the photonic mode functions" % precision)
+        self.precision = precision
 
         if self.apply_photon is False:
             self.n_mode_x = 0
@@ -908,6 +1358,7 @@ class PhotonDriverFabryPerot():
             self.n_photon = self.n_mode
         self.n_photon_3 = self.n_photon * 3
         self.pos_ph = np.zeros(self.n_photon_3)
+        self.pos_ph2d = self.pos_ph.reshape((-1, 3))
 
         # generate 2D grid points of molecular bath coords in units of Lx, Ly
         self.x_grid_2d, self.y_grid_2d = np.meshgrid(self.x_grid_1d, self.y_grid_1d)
@@ -919,8 +1370,8 @@ class PhotonDriverFabryPerot():
         self.n_grid = np.size(self.x_grid_2d)
 
         # generate 2D grid points of kx, ky in units of 1/Lx, 1/Ly
-        self.kx_grid_1d = np.pi * np.array([i+1.0 for i in range(self.n_mode_x)]) * self.kx_coeff
-        self.ky_grid_1d = np.pi * np.array([i+1.0 for i in range(self.n_mode_y)]) * self.ky_coeff
+        self.kx_grid_1d = np.pi * np.arange(1.0, self.n_mode_x + 1.0) * self.kx_coeff
+        self.ky_grid_1d = np.pi * np.arange(1.0, self.n_mode_y + 1.0) * self.ky_coeff
         self.kx_grid_2d, self.ky_grid_2d = np.meshgrid(self.kx_grid_1d, self.ky_grid_1d)
         self.kx_grid_2d = np.reshape(self.kx_grid_2d, -1)
         self.ky_grid_2d = np.reshape(self.ky_grid_2d, -1)
@@ -936,15 +1387,16 @@ class PhotonDriverFabryPerot():
         # construct cavity mode frequency array for all photon dimensions
         omega_parallel = np.reshape( ((self.kx_grid_2d / np.pi * self.domega_x)**2 
                          + (self.ky_grid_2d / np.pi * self.domega_y)**2)**0.5, -1)
-        print("omega_parallel in cm-1", omega_parallel * self.hartree_to_cminv)
         self.omega_k = (self.omega_c**2 + omega_parallel**2)**0.5
-        print("omega_k in cm-1", self.omega_k * self.hartree_to_cminv)
+        if verbosity.medium:
+            info(" @PhotonDriverFabryPerot: omega_parallel in cm-1 " + str(omega_parallel * self.hartree_to_cminv), True)
+            info(" @PhotonDriverFabryPerot: omega_k in cm-1 " + str(self.omega_k * self.hartree_to_cminv), True)
         if ph_rep == "loose":
             self.omega_klambda = np.concatenate((self.omega_k, self.omega_k))
         elif ph_rep == "dense":
             self.omega_klambda = self.omega_k
         #print("omega_klambda", self.omega_klambda)
-        self.omega_klambda3 = np.reshape(np.array([[x,x,x] for x in self.omega_klambda]), -1)
+        self.omega_klambda3 = np.repeat(self.omega_klambda, 3)
         #print("omega_klambda3", self.omega_klambda3)
 
         # construct varepsilon array for all photon dimensions
@@ -954,21 +1406,34 @@ class PhotonDriverFabryPerot():
         #print("varepsilon_klambda", self.varepsilon_klambda)
         #print("varepsilon3", self.varepsilon_klambda3)
 
+        # coefficients used at every step by the energy and force evaluations
+        self._omega_klambda3_sq = self.omega_klambda3**2
+        self._eps_over_omega2_full = self.varepsilon_k**2 / self.omega_k**2
+        self._eps_over_omega2 = 0.5 * self._eps_over_omega2_full
+
         # construct renormalized cavity mode function for each molecular grid point
-        self.ftilde_kx = np.zeros((self.n_mode, self.n_grid))
-        self.ftilde_ky = np.zeros((self.n_mode, self.n_grid))
-        for i in range(self.n_grid):
-            x, y = self.x_grid_2d[i], self.y_grid_2d[i]
-            self.ftilde_kx[:, i] = 2.0 * np.cos(self.kx_grid_2d * x) * np.sin(self.ky_grid_2d * y)
-            self.ftilde_ky[:, i] = 2.0 * np.sin(self.kx_grid_2d * x) * np.cos(self.ky_grid_2d * y)
-        self.ftilde_kx3 = np.reshape(np.array([[x, x, x] for x in self.ftilde_kx]), -1)
-        self.ftilde_ky3 = np.reshape(np.array([[x, x, x] for x in self.ftilde_ky]), -1)
-        print("x_grid_2d (units of Lx, Ly)", self.x_grid_2d)
-        print("y_grid_2d (units of Lx, Ly)", self.y_grid_2d)
+        # (n_mode, n_grid) outer products of the mode wavevectors and the grid points
+        kx_x = np.multiply.outer(self.kx_grid_2d, self.x_grid_2d)
+        ky_y = np.multiply.outer(self.ky_grid_2d, self.y_grid_2d)
+        self.ftilde_kx = 2.0 * np.cos(kx_x) * np.sin(ky_y)
+        self.ftilde_ky = 2.0 * np.sin(kx_x) * np.cos(ky_y)
+        # each mode row repeated three times, as in the [1x, 1y, 1z, 2x, ...] layout
+        self.ftilde_kx3 = np.repeat(self.ftilde_kx[:, np.newaxis, :], 3, axis=1).ravel()
+        self.ftilde_ky3 = np.repeat(self.ftilde_ky[:, np.newaxis, :], 3, axis=1).ravel()
+        if verbosity.medium:
+            info(" @PhotonDriverFabryPerot: x_grid_2d (units of Lx, Ly) " + str(self.x_grid_2d), True)
+            info(" @PhotonDriverFabryPerot: y_grid_2d (units of Lx, Ly) " + str(self.y_grid_2d), True)
         #print("kx_grid_2d", self.kx_grid_2d)
         #print("ky_grid_2d", self.ky_grid_2d)
-        print("mode function f_kx", self.ftilde_kx)
-        print("mode function f_ky", self.ftilde_ky)
+        # the mode functions can be large, so they are only printed in full when debugging
+        if verbosity.debug:
+            info(" @PhotonDriverFabryPerot: mode function f_kx " + str(self.ftilde_kx), True)
+            info(" @PhotonDriverFabryPerot: mode function f_ky " + str(self.ftilde_ky), True)
+        else:
+            info(" @PhotonDriverFabryPerot: mode functions f_kx, f_ky of shape %s" % str(self.ftilde_kx.shape), verbosity.medium)
+        # the mode functions are the largest arrays, streamed at every step
+        self.ftilde_kx = self.ftilde_kx.astype(self._f_dtype, copy=False)
+        self.ftilde_ky = self.ftilde_ky.astype(self._f_dtype, copy=False)
          
     def split_atom_ph_coord(self, pos):
 
@@ -985,11 +1450,68 @@ class PhotonDriverFabryPerot():
             pos_at = pos[:-self.n_photon_3]
             pos_ph = pos[-self.n_photon_3:]
             self.pos_ph = pos_ph
+            self.pos_ph2d = pos_ph.reshape((-1, 3))
         else:
             pos_at = pos
             pos_ph = pos[0:0]
         return pos_at, pos_ph
 
+    def _project_dipoles(self, dx_array, dy_array):
+
+        """
+        Return the dot products between mode functions and dipole arrays, in
+        double precision whatever the precision of the mode functions
+
+        Args:
+            dx_array: x-direction dipole array of molecular subsystems in 2d grid
+            dy_array: y-direction dipole array of molecular subsystems in 2d grid
+        """
+        dt = self._f_dtype
+        if self._gemv is not None:
+            # the transposes are Fortran-ordered views of the mode functions
+            d_dot_f_x = self._gemv(1.0, self.ftilde_kx.T, dx_array.astype(dt, copy=False), trans=1)
+            d_dot_f_y = self._gemv(1.0, self.ftilde_ky.T, dy_array.astype(dt, copy=False), trans=1)
+        else:
+            d_dot_f_x = np.dot(self.ftilde_kx, dx_array.astype(dt, copy=False))
+            d_dot_f_y = np.dot(self.ftilde_ky, dy_array.astype(dt, copy=False))
+        return d_dot_f_x.astype(np.float64, copy=False), d_dot_f_y.astype(np.float64, copy=False)
+
+    def _expand_modes(self, Ekx, Eky):
+
+        """
+        Return the per-grid-point sums of mode arrays weighted by the mode
+        functions, in double precision whatever the precision of the mode functions
+
+        Args:
+            Ekx: x-polarized array, one value per mode
+            Eky: y-polarized array, one value per mode
+        """
+        dt = self._f_dtype
+        if self._gemv is not None:
+            coeff_x = self._gemv(1.0, self.ftilde_kx.T, Ekx.astype(dt, copy=False))
+            coeff_y = self._gemv(1.0, self.ftilde_ky.T, Eky.astype(dt, copy=False))
+        else:
+            coeff_x = np.dot(Ekx.astype(dt, copy=False), self.ftilde_kx)
+            coeff_y = np.dot(Eky.astype(dt, copy=False), self.ftilde_ky)
+        return coeff_x.astype(np.float64, copy=False), coeff_y.astype(np.float64, copy=False)
+
+    def _xy_views(self, v2d):
+
+        """
+        Return the components of a (nphoton, 3) photonic array that couple to
+        the x and y dipoles, as column views
+
+        Args:
+            v2d: A (nphoton, 3) array, e.g. photonic coordinates or forces
+
+        Returns:
+            x-polarized and y-polarized components, one per mode
+        """
+        if self.ph_rep == "loose":
+            return v2d[:self.n_mode, 0], v2d[self.n_mode:, 1]
+        elif self.ph_rep == "dense":
+            return v2d[:, 0], v2d[:, 1]
+
     def get_ph_energy(self, dx_array, dy_array):
         
         """
@@ -1004,22 +1526,18 @@ class PhotonDriverFabryPerot():
             total energy of photonic system
         """
         # calculate the photonic potential energy
-        e_ph = np.sum(0.5 * self.omega_klambda3**2 * self.pos_ph**2)
+        e_ph = 0.5 * np.einsum("i,i,i", self._omega_klambda3_sq, self.pos_ph, self.pos_ph)
         
         # calculate the dot products between mode functions and dipole array
-        d_dot_f_x = np.dot(self.ftilde_kx, dx_array)
-        d_dot_f_y = np.dot(self.ftilde_ky, dy_array)
+        d_dot_f_x, d_dot_f_y = self._project_dipoles(dx_array, dy_array)
 
         # calculate the light-matter interaction
-        if self.ph_rep == "loose":
-            e_int_x = np.sum(self.varepsilon_k * d_dot_f_x * self.pos_ph[:self.n_mode*3:3])
-            e_int_y = np.sum(self.varepsilon_k * d_dot_f_y * self.pos_ph[1+self.n_mode*3::3])
-        elif self.ph_rep == "dense":
-            e_int_x = np.sum(self.varepsilon_k * d_dot_f_x * self.pos_ph[::3])
-            e_int_y = np.sum(self.varepsilon_k * d_dot_f_y * self.pos_ph[1::3])
+        qx, qy = self._xy_views(self.pos_ph2d)
+        e_int_x = np.sum(self.varepsilon_k * d_dot_f_x * qx)
+        e_int_y = np.sum(self.varepsilon_k * d_dot_f_y * qy)
 
         # calculate the dipole self-energy term
-        dse = np.sum((self.varepsilon_k**2 / 2.0 / self.omega_k**2) * (d_dot_f_x**2 + d_dot_f_y**2))
+        dse = np.dot(self._eps_over_omega2, d_dot_f_x**2 + d_dot_f_y**2)
 
         e_tot = e_ph + e_int_x + e_int_y + dse
 
@@ -1038,17 +1556,14 @@ class PhotonDriverFabryPerot():
             force array of all photonic dimensions (3*nphoton) [1x, 1y, 1z, 2x..]
         """
         # calculat the bare photonic contribution of the force
-        f_ph = - self.omega_klambda3**2 * self.pos_ph
+        f_ph = np.multiply(self._omega_klambda3_sq, self.pos_ph)
+        np.negative(f_ph, out=f_ph)
         # calculate the dot products between mode functions and dipole array
-        d_dot_f_x = np.dot(self.ftilde_kx, dx_array)
-        d_dot_f_y = np.dot(self.ftilde_ky, dy_array)  
+        d_dot_f_x, d_dot_f_y = self._project_dipoles(dx_array, dy_array)
         # calculate the force due to light-matter interactions
-        if self.ph_rep == "loose":
-            f_ph[:self.n_mode*3:3] -= self.varepsilon_k * d_dot_f_x
-            f_ph[self.n_mode*3+1::3] -= self.varepsilon_k * d_dot_f_y
-        elif self.ph_rep == "dense":  
-            f_ph[::3] -= self.varepsilon_k * d_dot_f_x
-            f_ph[1::3] -= self.varepsilon_k * d_dot_f_y   
+        fx, fy = self._xy_views(f_ph.reshape((-1, 3)))
+        fx -= self.varepsilon_k * d_dot_f_x
+        fy -= self.varepsilon_k * d_dot_f_y
         return f_ph
 
     def get_nuc_cav_forces(self, dx_array, dy_array, charge_array_bath):
@@ -1066,26 +1581,89 @@ class PhotonDriverFabryPerot():
         """
 
         # calculate the dot products between mode functions and dipole array
-        d_dot_f_x = np.dot(self.ftilde_kx, dx_array)
-        d_dot_f_y = np.dot(self.ftilde_ky, dy_array)
+        d_dot_f_x, d_dot_f_y = self._project_dipoles(dx_array, dy_array)
 
         # cavity force on x direction
-        if self.ph_rep == "loose":
-            Ekx = self.varepsilon_k * self.pos_ph[:self.n_mode*3:3]  
-            Eky = self.varepsilon_k * self.pos_ph[self.n_mode*3+1::3]  
-        elif self.ph_rep == "dense":
-            Ekx = self.varepsilon_k * self.pos_ph[::3]  
-            Eky = self.varepsilon_k * self.pos_ph[1::3]  
-        Ekx += self.varepsilon_k**2/self.omega_k**2 * d_dot_f_x
-        Eky += self.varepsilon_k**2/self.omega_k**2 * d_dot_f_y
+        qx, qy = self._xy_views(self.pos_ph2d)
+        Ekx = self.varepsilon_k * qx
+        Eky = self.varepsilon_k * qy
+        Ekx += self._eps_over_omega2_full * d_dot_f_x
+        Eky += self._eps_over_omega2_full * d_dot_f_y
 
         # dimension of independent baths (xy grid points)
-        coeff_x = np.dot(np.transpose(Ekx), self.ftilde_kx)
-        coeff_y = np.dot(np.transpose(Eky), self.ftilde_ky)
-        fx = -np.kron(coeff_x, charge_array_bath)
-        fy = -np.kron(coeff_y, charge_array_bath)
+        coeff_x, coeff_y = self._expand_modes(Ekx, Eky)
+        fx = np.multiply.outer(np.negative(coeff_x, out=coeff_x), charge_array_bath).ravel()
+        fy = np.multiply.outer(np.negative(coeff_y, out=coeff_y), charge_array_bath).ravel()
         return fx, fy
 
+    def compute_photon_contribs(self, dx_array, dy_array, charge_array_bath, out=None, f_nuc=None):
+
+        """
+        Calculate the photonic energy, the photonic forces and the cavity forces
+        on nuclei in a single pass, projecting the dipoles on the mode functions
+        only once. Equivalent to calling get_ph_energy, get_ph_forces and
+        get_nuc_cav_forces in turn.
+
+        Args:
+            dx_array: x-direction dipole array of molecular subsystems in 2d grid
+            dy_array: y-direction dipole array of molecular subsystems in 2d grid
+            charge_array_bath: partial charges of all atoms in a single bath
+            out: optional array of size 3*nphoton the photonic forces are
+                written into, e.g. the photonic part of the total force array
+            f_nuc: optional contiguous force array of all nuclear dimensions
+                (3*natoms), the cavity forces on nuclei are added to. In this
+                case they are not returned separately.
+
+        Returns:
+            total energy of photonic system, force array of all photonic
+            dimensions, x and y cavity force arrays of all nuclei (None if
+            f_nuc is given)
+        """
+        # calculate the dot products between mode functions and dipole array
+        d_dot_f_x, d_dot_f_y = self._project_dipoles(dx_array, dy_array)
+
+        qx, qy = self._xy_views(self.pos_ph2d)
+
+        # the light-matter couplings and the self-energy fields, shared by the
+        # energy and both forces
+        efx = self.varepsilon_k * d_dot_f_x
+        efy = self.varepsilon_k * d_dot_f_y
+        gx = self._eps_over_omega2_full * d_dot_f_x
+        gy = self._eps_over_omega2_full * d_dot_f_y
+
+        # bare photonic forces, -omega**2 q, whose product with q also gives
+        # the photonic potential energy without another full-size temporary
+        f_ph = np.multiply(self._omega_klambda3_sq, self.pos_ph, out=out)
+        e_ph = 0.5 * np.dot(f_ph, self.pos_ph)
+        np.negative(f_ph, out=f_ph)
+
+        # light-matter interaction and dipole self-energy
+        e_int = np.dot(efx, qx) + np.dot(efy, qy)
+        dse = 0.5 * (np.dot(gx, d_dot_f_x) + np.dot(gy, d_dot_f_y))
+
+        # photonic forces
+        f_phx, f_phy = self._xy_views(f_ph.reshape((-1, 3)))
+        f_phx -= efx
+        f_phy -= efy
+
+        # cavity forces on nuclei, as the outer product of the per-bath
+        # coefficients with the charges (the sign goes on the short factor)
+        Ekx = self.varepsilon_k * qx
+        Ekx += gx
+        Eky = self.varepsilon_k * qy
+        Eky += gy
+        coeff_x, coeff_y = self._expand_modes(Ekx, Eky)
+        if f_nuc is not None:
+            # (bath, atom, xyz) view of the nuclear forces
+            f3 = f_nuc.reshape((len(coeff_x), -1, 3))
+            f3[:, :, 0] -= np.multiply.outer(coeff_x, charge_array_bath)
+            f3[:, :, 1] -= np.multiply.outer(coeff_y, charge_array_bath)
+            return e_ph + e_int + dse, f_ph, None, None
+        fx = np.multiply.outer(np.negative(coeff_x, out=coeff_x), charge_array_bath).ravel()
+        fy = np.multiply.outer(np.negative(coeff_y, out=coeff_y), charge_array_bath).ravel()
+
+        return e_ph + e_int + dse, f_ph, fx, fy
+
 class FFCavPhFPSocket(ForceField):
 
     """
@@ -1109,13 +1687,15 @@ class FFCavPhFPSocket(ForceField):
     def __init__(self, latency=1.0, name="", pars=None, dopbc=False,
                  active=np.array([-1]), threaded=True, interface=None,
                  n_independent_bath=1,
+                 batched_request=False,
                  n_qm_atom=0,
                  mm_charge_array=None,
                  qm_charge_array=None,
                  charge_array=None,
                  apply_photon=True, E0=1e-4, omega_c_cminv=3400.0, domega_x_cminv=100.0, 
                  domega_y_cminv=100.0, n_mode_x=4, n_mode_y=3, x_grid_1d=np.array([0.1, 0.5, 0.9]), 
-                 y_grid_1d=np.array([0.1, 0.5]), ph_constraint="none", ph_rep="loose"):
+                 y_grid_1d=np.array([0.1, 0.5]), ph_constraint="none", ph_rep="loose",
+                 ph_precision="double"):
 
         """Initialises FFCavPhFPSocket.
 
@@ -1129,6 +1709,10 @@ class FFCavPhFPSocket(ForceField):
               before sending the positions to the client code.
            interface: The object used to create the socket used to interact
               with the client codes.
+           n_independent_bath: The number of identical independent baths.
+           batched_request: Whether all the baths are sent to the client as a
+              single request, for drivers that treat them as independent
+              replicas themselves, rather than as one request per bath.
         """
 
         # a socket to the communication library is created or linked
@@ -1141,8 +1725,13 @@ class FFCavPhFPSocket(ForceField):
 
         # definition of independent baths
         self.n_independent_bath = n_independent_bath
+        self.batched_request = batched_request
         self.mm_charge_array = mm_charge_array
         self.qm_charge_array = qm_charge_array
+        # the charges are contracted with the positions of all the baths at every step,
+        # so keep them as contiguous floats
+        if charge_array is not None:
+            charge_array = np.ascontiguousarray(charge_array, dtype=float)
         self.charge_array = charge_array
         self.n_qm_atom = n_qm_atom
 
@@ -1158,13 +1747,16 @@ class FFCavPhFPSocket(ForceField):
         self.y_grid_1d = y_grid_1d
         self.ph_constraint = ph_constraint
         self.ph_rep = ph_rep
+        self.ph_precision = ph_precision
         # define the photon environment
         self.ph = PhotonDriverFabryPerot(apply_photon=apply_photon, E0=E0, omega_c_cminv=omega_c_cminv, 
                     domega_x_cminv=domega_x_cminv, domega_y_cminv=domega_y_cminv, n_mode_x=n_mode_x, 
                     n_mode_y=n_mode_y, x_grid_1d=x_grid_1d, y_grid_1d=y_grid_1d, ph_constraint=ph_constraint,
-                    ph_rep=ph_rep)
+                    ph_rep=ph_rep, precision=ph_precision)
 
         self._getallcount = 0
+        # per-bead buffers for the total forces and virial, see queue()
+        self._result_bufs = {}
 
     def calc_dipole_xyz_mm(self, pos, n_bath, charge_array_bath):
 
@@ -1179,22 +1771,10 @@ class FFCavPhFPSocket(ForceField):
         Returns: 
             dx_array, dy_array, dz_array: total dipole moment array along x, y, and z directions
         """
-        ndim_tot = np.size(pos)
-        ndim_local = int(ndim_tot // n_bath)
-
-        dx_array, dy_array, dz_array = [], [], []
-        for idx in range(n_bath):
-            pos_bath = pos[ndim_local*idx:ndim_local*(idx+1)]
-            dx = np.sum(pos_bath[::3] * charge_array_bath)
-            dy = np.sum(pos_bath[1::3] * charge_array_bath)
-            dz = np.sum(pos_bath[2::3] * charge_array_bath)
-            dx_array.append(dx)
-            dy_array.append(dy)
-            dz_array.append(dz)
-        dx_array = np.array(dx_array)
-        dy_array = np.array(dy_array)
-        dz_array = np.array(dz_array)
-        return dx_array, dy_array, dz_array
+        # (bath, atom, xyz) view of the positions, contracted with the charges
+        pos3 = np.reshape(pos, (n_bath, -1, 3))
+        d = np.einsum("bij,i->bj", pos3, charge_array_bath)
+        return d[:, 0], d[:, 1], d[:, 2]
 
     def queue(self, atoms, cell, reqid=-1):
         """Adds a request.
@@ -1220,75 +1800,65 @@ class FFCavPhFPSocket(ForceField):
             the starting time for the calculation, used to check for timeouts.}.
         """
 
-        par_str = " "
+        par_str = self._par_str
 
-        if not self.pars is None:
-            for k, v in list(self.pars.items()):
-                par_str += k + " : " + str(v) + " , "
-        else:
-            par_str = " "
-
-        pbcpos = dstrip(atoms.q).copy()
-
-        # Indexes come from input in a per atom basis and we need to make a per atom-coordinate basis
-        # Reformat indexes for full system (default) or piece of system
-        # active atoms do not change but we only know how to build this array once we get the positions once
-        if self.iactive is None:
-            if self.active[0] == -1:
-                activehere = np.arange(len(pbcpos))
-            else:
-                activehere = np.array([[3 * n, 3 * n + 1, 3 * n + 2] for n in self.active])
+        # the atomic coordinates are copied below before being wrapped, so the
+        # full position array is never modified and needs no copy
+        pbcpos = dstrip(atoms.q).view()
+        pbcpos.flags.writeable = False
 
-            # Reassign active indexes in order to use them
-            activehere = activehere.flatten()
-
-            # Perform sanity check for active atoms
-            if (len(activehere) > len(pbcpos) or activehere[-1] > (len(pbcpos) - 1)):
-                raise ValueError("There are more active atoms than atoms!")
-
-            self.iactive = activehere
+        iactive = self._get_iactive(len(pbcpos))
         
         newreq_lst = []
 
         # 1. split coordinates to atoms and photons
         pbcpos_atoms, pbcpos_phs = self.ph.split_atom_ph_coord(pbcpos)
         ndim_tot = np.size(pbcpos_atoms)
-        ndim_local = int(ndim_tot // self.n_independent_bath)
+        # with batched requests, all the baths go to the client at once
+        n_req = 1 if self.batched_request else self.n_independent_bath
+        ndim_local = int(ndim_tot // n_req)
+
+        # the active indices and the cell are the same for all the baths
+        iactive_local = iactive[0:ndim_local]
+        hih = self._get_cell(cell)
+
+        # the atomic coordinates of all the baths are copied and folded back
+        # into the cell at once, and each request gets a read-only slice
+        pos_baths = pbcpos_atoms.copy()
+        if self.dopbc:
+            cell.array_pbc(pos_baths)
+        pos_baths.flags.writeable = False
 
         # 2. for atomic coordinates, we now evaluate their atomic forces
-        for idx in range(self.n_independent_bath):
-            pbcpos_local = pbcpos_atoms[ndim_local*idx:ndim_local*(idx+1)].copy()
-            iactive_local = self.iactive[0:ndim_local]
-            # Let's try to do PBC for the small regions
-            if self.dopbc:
-                cell.array_pbc(pbcpos_local)
+        for idx in range(n_req):
+            pbcpos_local = pos_baths[ndim_local*idx:ndim_local*(idx+1)]
             newreq_local = ForceRequest({
-                "id": int(reqid*self.n_independent_bath) + idx,
+                "id": int(reqid*n_req) + idx,
                 "pos": pbcpos_local,
                 "active": iactive_local,
-                "cell": (dstrip(cell.h).copy(), dstrip(cell.ih).copy()),
+                "cell": hih,
                 "pars": par_str,
                 "result": None,
                 "status": "Queued",
                 "start": -1,
-                "t_queued": time.time(),
+                "profile": self._profile,
+                "t_queued": time.monotonic_ns() if self._profile else 0,
                 "t_dispatched": 0,
                 "t_finished": 0
             })
             newreq_lst.append(newreq_local)
 
         with self._threadlock:
-            for newreq in newreq_lst:
-                self.requests.append(newreq)
-                self._getallcount += 1
+            self._getallcount += len(newreq_lst)
+        self.requests.extend(newreq_lst)
 
         if not self.threaded:
             self.poll()
 
-        # sleeps until all the new requests have been evaluated
-        import sys
+        # waits until all the new requests have been evaluated, waking up
+        # every latency seconds to check for a soft exit
         for self.request in newreq_lst:
-            while self.request["status"] != "Done":
+            while not (self.request.wait(self.latency) and self.request["status"] == "Done"):
                 if self.request["status"] == "Exit" or softexit.triggered:
                 # now, this is tricky. we are stuck here and we cannot return meaningful results.
                 # if we return, we may as well output wrong numbers, or mess up things.
@@ -1298,7 +1868,6 @@ class FFCavPhFPSocket(ForceField):
                     while softexit.exiting:
                         time.sleep(self.latency)
                     sys.exit()
-                time.sleep(self.latency)
             
             """
             with self._threadlock:
@@ -1318,7 +1887,18 @@ class FFCavPhFPSocket(ForceField):
         # ...atomic forces have been calculated at this point
         
         # 3. At this moment, we combine the small requests to a big mega request (update results)
-        result_tot = [0.0, np.zeros(len(pbcpos), float), np.zeros((3, 3), float), ""]
+        # the force and virial buffers of each bead (reqid) are reused from step
+        # to step. The previous results of a bead have been copied out by the
+        # time it is queued again, since its forces are recomputed only then.
+        bufs = self._result_bufs.get(reqid)
+        if bufs is None or len(bufs[0]) != len(pbcpos):
+            bufs = (np.empty(len(pbcpos), float), np.empty((3, 3), float))
+            self._result_bufs[reqid] = bufs
+        # the forces of the baths overwrite their slices below, so only the rest
+        # (the photonic part) needs to be zeroed
+        bufs[0][ndim_local*n_req:].fill(0.0)
+        bufs[1].fill(0.0)
+        result_tot = [0.0, bufs[0], bufs[1], ""]
         for idx, newreq in enumerate(newreq_lst):
             u, f, vir, extra =  newreq["result"]
             result_tot[0] += u
@@ -1331,40 +1911,23 @@ class FFCavPhFPSocket(ForceField):
             # 4. calculate total dipole moment array for N baths
             dx_array, dy_array, dz_array = self.calc_dipole_xyz_mm(pos=pbcpos_atoms, n_bath=self.n_independent_bath, charge_array_bath=self.charge_array)
             #info("mux = %.6f muy = %.6f muz = %.6f [units of a.u.]" %(dipole_x_tot, dipole_y_tot, dipole_z_tot), verbosity.medium)
-            # 5. calculate photonic contribution of total energy
-            e_ph = self.ph.get_ph_energy(dx_array=dx_array, dy_array=dy_array)
-            # 6. calculate photonic forces
-            f_ph = self.ph.get_ph_forces(dx_array=dx_array, dy_array=dy_array)
-            # 7. calculate cavity forces on nuclei
-            fx_cav, fy_cav = self.ph.get_nuc_cav_forces(dx_array=dx_array, dy_array=dy_array, charge_array_bath=self.charge_array)
-            # 8. add cavity effects to our output
+            # 5-8. calculate photonic energy, photonic forces and cavity forces on nuclei;
+            # the forces are written directly in the total force array
+            e_ph = self.ph.compute_photon_contribs(dx_array=dx_array, dy_array=dy_array, charge_array_bath=self.charge_array,
+                                                 out=result_tot[1][ndim_tot:], f_nuc=result_tot[1][:ndim_tot])[0]
             result_tot[0] += e_ph
-            result_tot[1][:ndim_tot:3] += fx_cav
-            result_tot[1][1:ndim_tot:3] += fy_cav
-            result_tot[1][ndim_tot:] = f_ph
-            # additional output for debugging
-            """
-            print("f_photon", f_ph)
-            print("e_photon", e_ph)
-            print("fx_nuc_cav", fx_cav[0:10])
-            print("fy_nuc_cav", fy_cav[0:10])
-            print("fx_cav dimension", fx_cav.size)
-            print("fy_cav dimension", fy_cav.size)
-            n_local = int(ndim_local // 3)
-            print("fx_nuc_cav 2", fx_cav[n_local:n_local+10])
-            print("fy_nuc_cav 2", fy_cav[n_local:n_local+10])
-            """
         
         # At this moment, we have sucessfully gathered the CavMD forces
         newreq = ForceRequest({
             "id": reqid,
             "pos": pbcpos,
-            "active": self.iactive,
-            "cell": (dstrip(cell.h).copy(), dstrip(cell.ih).copy()),
+            "active": iactive,
+            "cell": hih,
             "pars": par_str,
             "result": result_tot,
             "status": newreq_lst[-1]["status"],
             "start": newreq_lst[0]["start"],
+            "profile": self._profile,
             "t_queued": newreq_lst[0]["t_queued"],
             "t_dispatched": newreq_lst[0]["t_dispatched"],
             "t_finished": newreq_lst[-1]["t_finished"]
@@ -1392,6 +1955,150 @@ class FFCavPhFPSocket(ForceField):
             self._thread.join()
         self.socket.close()
 
+
+def _read_table(filename):
+    """Reads a whitespace-separated table of numbers written by a driver.
+
+    Gives the same array as np.loadtxt for plain files without comments,
+    i.e. a scalar, a vector for a single row or column, or a matrix, but
+    parses all the numbers at once in C rather than line by line.
+
+    Args:
+        filename: The name of the file to read.
+
+    Raises:
+        ValueError: Raised, as by np.loadtxt, if some of the entries are not
+            numbers or if the rows do not all have the same length, e.g.
+            when the file has only been partly written.
+    """
+
+    with open(filename, "r") as f:
+        text = f.read()
+    # only the number of fields of each line is counted in python
+    ncols = [n for n in map(len, map(str.split, text.splitlines())) if n > 0]
+    if len(set(ncols)) > 1:
+        raise ValueError("The rows of %s have different lengths" % filename)
+    data = np.fromstring(text, sep=" ")
+    if data.size != sum(ncols):
+        raise ValueError("Could not read all the numbers in " + filename)
+    if len(ncols) > 1:
+        data = data.reshape((len(ncols), -1))
+    return np.squeeze(data)
+
+
+def _charge_dipder(charges):
+    """Returns the dipole derivatives of a set of fixed point charges, with
+    shape (3*natoms, 3), as a read-only array."""
+
+    # each atom has a diagonal 3x3 block: dmux/dx = dmuy/dy = dmuz/dz = charge
+    dipder = np.zeros((charges.size, 3, 3))
+    diag = np.arange(3)
+    dipder[:, diag, diag] = charges[:, np.newaxis]
+    dipder = dipder.reshape((-1, 3))
+    dipder.flags.writeable = False
+    return dipder
+
+
+def _communicate_all(processes):
+    """Waits for a list of subprocesses, draining all their pipes concurrently.
+
+    Calling communicate() on one process after the other would let a later
+    process stall on a full output pipe until all the earlier ones have
+    finished, so each process is drained by its own thread.
+
+    Args:
+        processes: A list of subprocess.Popen objects.
+
+    Returns:
+        A list with the (stdout, stderr) tuple of each process.
+
+    Raises:
+        The first exception raised while waiting for one of the processes,
+        once all of them have been waited for.
+    """
+
+    output = [None] * len(processes)
+    errors = [None] * len(processes)
+
+    def drain(i):
+        # an exception would otherwise only be printed by the thread
+        try:
+            output[i] = processes[i].communicate()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=drain, args=(i,)) for i in range(len(processes))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for e in errors:
+        if e is not None:
+            raise e
+    return output
+
+
+class _PersistentDriver(object):
+
+    """A run_qc_driver script that is kept running between steps.
+
+    The script is started once as "./name persistent IPI_DRIVER_TEMP_n". At
+    each step, it receives on its standard input the arguments it would get
+    on the command line otherwise: first a line with the number of arguments,
+    then, for each argument, a line with its number of lines followed by these
+    lines. It writes its output files as usual, then prints a single line on
+    its standard output. Closing its standard input asks it to quit.
+
+    Attributes:
+       process: The subprocess.Popen object of the script.
+    """
+
+    def __init__(self, name, workdir):
+        """Starts the script."""
+
+        import subprocess
+        self.process = subprocess.Popen(["./" + name, "persistent", workdir],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+
+    def send(self, args):
+        """Sends the arguments of a new evaluation to the script."""
+
+        msg = ["%d\n" % len(args)]
+        for arg in args:
+            lines = arg.splitlines()
+            msg.append("%d\n" % len(lines))
+            msg.extend(line + "\n" for line in lines)
+        try:
+            self.process.stdin.write("".join(msg))
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            # the script has exited, which communicate() reports
+            pass
+        return self
+
+    def communicate(self):
+        """Waits for the script to be done with the current evaluation, with
+        the same return value as subprocess.Popen.communicate."""
+
+        reply = self.process.stdout.readline()
+        if not reply:
+            # reaps the script, so that _start_driver sees it has exited
+            self.process.wait()
+            raise RuntimeError("The persistent driver in %s has exited" % self.process.args[-1])
+        return reply, None
+
+    def close(self):
+        """Asks the script to quit and waits for it."""
+
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+        self.process.stdout.close()
+
+
 class FFCavPh(ForceField):
 
     """Full pythonic CavPh interference
@@ -1414,13 +2121,19 @@ class FFCavPh(ForceField):
                 n_independent_bath=1,
                 n_qm_atom=-1,
                 mm_charge_array=np.array([]),
-                qm_charge_array=np.array([])
+                qm_charge_array=np.array([]),
+                binary_geometry=False,
+                persistent_drivers=False
                 ):
         """Initialises FFCavPh.
 
         Args:
            pars: Optional dictionary, giving the parameters needed by the driver.
            n_itp_dipder: calculate dipder every n_itp_dipder step
+           binary_geometry: pass the geometry to the run_qc_driver scripts as the
+              path of a binary file rather than as text
+           persistent_drivers: keep one run_qc_driver script per bath running
+              between steps, see _PersistentDriver
         """
 
         # a socket to the communication library is created or linked
@@ -1444,6 +2157,8 @@ class FFCavPh(ForceField):
         self.nthread = nthread
         self.name = name
         self.qchem_template = qchem_template
+        self.binary_geometry = binary_geometry
+        self.persistent_drivers = persistent_drivers
         print("Ab initio code will read initial config from", self.input_xyz_filename)
         self.n_independent_bath = n_independent_bath
         if self.n_independent_bath > 1:
@@ -1459,8 +2174,9 @@ class FFCavPh(ForceField):
 
         # load the function of QM/MM part
         self.n_qm_atom = n_qm_atom
-        self.mm_charge_array = mm_charge_array
-        self.qm_charge_array = qm_charge_array
+        # the charges are contracted with the positions at every step, so keep them as contiguous floats
+        self.mm_charge_array = np.ascontiguousarray(mm_charge_array, dtype=float)
+        self.qm_charge_array = np.ascontiguousarray(qm_charge_array, dtype=float)
         self.do_qmmm = False
         if self.n_qm_atom > 0 and self.n_qm_atom < self.nat_idb:
             # check the correctness of input
@@ -1476,6 +2192,9 @@ class FFCavPh(ForceField):
             self.do_qmmm = True
             self.n_mm_atom = self.nat_idb - self.n_qm_atom
             print("mm charge array size is", self.mm_charge_array.size)
+        # the MM atoms only contribute to the dipole and its derivatives if some of them are
+        # charged. by default they are not, and all of the MM work can be skipped
+        self._mm_charged = self.do_qmmm and bool(np.any(self.mm_charge_array))
         # check the validity of QM Charge Array
         if self.qm_charge_array.size > 0:
             print("#! QM atoms assigned with pre-defined partial charges, will not calculate dipole or dipder explicitly")
@@ -1489,7 +2208,7 @@ class FFCavPh(ForceField):
             # Initialize psi4 object
             try:
                 import psi4
-            except:
+            except ImportError:
                 raise ImportError("!!!Please install psi4 and psi4numpy interface!!!")
             psi4.set_memory(self.memory_usage)
             numpy_memory = self.numpy_memory
@@ -1504,6 +2223,8 @@ class FFCavPh(ForceField):
                 self.init_nuclear_str_idb = "\n".join(self.init_nuclear_str.split("\n")[:self.nat_idb])
                 print(self.init_nuclear_str_idb)
                 self.molec = psi4.geometry(self.init_nuclear_str_idb + "\n symmetry c1\n noreorient \n nocom")
+            # the geometry is passed to psi4 through a matrix that is allocated once
+            self._psi4_geom = psi4.core.Matrix("geometry", self.molec.natom(), 3)
         elif self.name == "run_qe_driver.sh" or ("run_qc_driver" in self.name):
             print("Will run the bash script '%s' on the local path..." %self.name)
         elif self.name == "qchem-neo":
@@ -1513,73 +2234,148 @@ class FFCavPh(ForceField):
             with open(self.qchem_template, 'r') as f:
                 self.qchem_template_content = f.read()
                 print(self.qchem_template_content)
+            # the atomic labels are fixed, so they are baked in the format of the geometry block
+            self._qchem_geometry_fmt = "".join("%s  %%.10f  %%.10f  %%.10f\n" % label for label in self.atom_label_lst[:self.nat])
         else:
             raise ValueError("%s pythonic force field is unavailable currently" %self.name)
 
         self.error_flag = False
+        self._qm_charge_dipder = {}
+        self._mm_charge_dipder = None
+        self._bath_charges = None
+        self._geometry_fmts = {}
+        self._labels_written = set()
+        self._dipder_buf = None
+        self._cell_rvecs = None
+        self._drivers = {}
+        self._evallock = threading.Lock()
+        # per-bead buffers for the total forces, and scratch arrays for the
+        # cavity forces, see evaluate()
+        self._result_bufs = {}
+        self._ph_coeff = np.zeros(3)
+        self._fcav_buf = None
 
     def initialize_from_xyz(self, filename):
-        if self.apply_photon:
-            thefile = open(filename, 'r')
+        with open(filename, 'r') as thefile:
             ntot = int(thefile.readline())
-            self.nat = ntot - self.photons.nphoton
-            print("Now CavPh force field will deal with %d atoms" %self.nat)
             thefile.readline()
-            # Remove several lines for photonic DoFs
-            str1 = ""
-            for i in range(self.nat):
-                str1 += thefile.readline()
-            #print("Atomic string is")
-            #print(str1)
-            # At the same time, I need a list to save the atomic labels
-            self.atom_label_lst = str1.split()[::4]
-            #print("atomic labels are", self.atom_label_lst)
-        else:
-            thefile = open(filename, 'r')
-            self.nat = int(thefile.readline())
-            print("CavPh force field will deal with %d atoms" %self.nat)
-            thefile.readline()
-            str1 = ""
-            for i in range(self.nat):
-                str1 += thefile.readline()
-            #print("Atomic string is")
-            #print(str1)
-            # At the same time, I need a list to save the atomic labels
-            self.atom_label_lst = str1.split()[::4]
-            #print("atomic labels are", self.atom_label_lst)
+            if self.apply_photon:
+                # Remove several lines for photonic DoFs
+                self.nat = ntot - self.photons.nphoton
+                print("Now CavPh force field will deal with %d atoms" %self.nat)
+            else:
+                self.nat = ntot
+                print("CavPh force field will deal with %d atoms" %self.nat)
+            lines = thefile.read().splitlines()[:self.nat]
+        str1 = "\n".join(lines) + "\n"
+        # At the same time, I need a list to save the atomic labels
+        self.atom_label_lst = [line.split(None, 1)[0] for line in lines]
         self.nat_idb = int(self.nat / self.n_independent_bath)
         return str1
 
+    def _driver_geometry(self, q, start, n, digits):
+        """Returns the "LABEL x y z" lines of the atoms start to start+n, with
+        the format of the atomic labels cached for each block."""
+
+        key = (start, n, digits)
+        fmt = self._geometry_fmts.get(key)
+        if fmt is None:
+            line = "%%s %%%%.%df %%%%.%df %%%%.%df\n" % (digits, digits, digits)
+            fmt = "".join(line % label for label in self.atom_label_lst[start:start+n])
+            self._geometry_fmts[key] = fmt
+        return fmt % tuple(np.ravel(q)[3*start:3*(start+n)].tolist())
+
+    def _driver_geometry_arg(self, q, idx_idb, digits):
+        """Returns the argument that passes the geometry of a bath to the
+        run_qc_driver scripts.
+
+        This is the "LABEL x y z" block of the bath or, with binary_geometry,
+        the path of a file with its coordinates as raw float64 x y z triplets.
+        The atomic labels are then written once to the labels file of the
+        same directory.
+        """
+
+        start = idx_idb * self.nat_idb
+        if not self.binary_geometry:
+            return self._driver_geometry(q, start, self.nat_idb, digits)
+
+        IPI_DRIVER_TEMP = "IPI_DRIVER_TEMP_%d" %(idx_idb+1)
+        if IPI_DRIVER_TEMP not in self._labels_written:
+            os.makedirs(IPI_DRIVER_TEMP, exist_ok=True)
+            with open("%s/labels" %IPI_DRIVER_TEMP, "w") as f:
+                f.write("\n".join(self.atom_label_lst[start:start+self.nat_idb]) + "\n")
+            self._labels_written.add(IPI_DRIVER_TEMP)
+        filename = "%s/geom.bin" %IPI_DRIVER_TEMP
+        np.ascontiguousarray(np.ravel(q)[3*start:3*(start+self.nat_idb)], dtype=np.float64).tofile(filename)
+        return filename
+
+    def _start_driver(self, idx_idb, args, stderr=None):
+        """Starts the evaluation of a bath by a run_qc_driver script.
+
+        Returns an object whose communicate() method waits for the end of the
+        evaluation: a new process, or the persistent driver of the bath.
+        """
+
+        import subprocess
+        if not self.persistent_drivers:
+            return subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr)
+
+        driver = self._drivers.get(idx_idb)
+        if driver is not None and driver.process.poll() is not None:
+            # the script died, e.g. during the previous step, so a new one is started
+            info(" @ForceField: the persistent driver of bath %d has exited with code %d, restarting it"
+                 % (idx_idb+1, driver.process.returncode), verbosity.low)
+            driver.close()
+            driver = None
+        if driver is None:
+            driver = _PersistentDriver(self.name, "IPI_DRIVER_TEMP_%d" %(idx_idb+1))
+            self._drivers[idx_idb] = driver
+        return driver.send(args[1:])
+
+    def stop(self):
+        """Stops the persistent driver scripts, if any."""
+
+        super(FFCavPh, self).stop()
+        for driver in self._drivers.values():
+            driver.close()
+        self._drivers = {}
+
     def construct_qchem_input(self, q, filename):
-        q = q.reshape((-1, 3)).copy()
+        # write molecular geometry, formatted at once and with a single write
+        geometry = self._qchem_geometry_fmt % tuple(np.ravel(q)[:3*self.nat].tolist())
         with open(filename, 'w') as f:
-            f.write("$molecule\n0 1\n")
-            # write molecular geometry
-            for i in range(self.nat):
-                f.write("%s  %.10f  %.10f  %.10f\n" %(self.atom_label_lst[i], q[i,0], q[i,1], q[i,2]))
-            f.write("$end\n\n")
-            f.write(self.qchem_template_content)
+            f.write("$molecule\n0 1\n" + geometry + "$end\n\n" + self.qchem_template_content)
 
     def poll(self):
         """ Polls the forcefield checking if there are requests that should
         be answered, and if necessary evaluates the associated forces and energy. """
 
-        # we have to be thread-safe, as in multi-system mode this might get called by many threads at once
+        # we have to be thread-safe, as in multi-system mode this might get called by many threads at once.
+        # the queue lock is only held while picking up the requests, so that new requests can be
+        # queued during the (slow) ab initio calculations. these change the state of the photons
+        # and of the QM codes, so they are serialized by a separate lock
         with self._threadlock:
-            for r in self.requests:
-                if r["status"] == "Queued":
-                    r["status"] = "Running"
-                    self.evaluate(r)
+            queued = [r for r in self.requests.queued() if r["status"] == "Queued"]
+            for r in queued:
+                r["status"] = "Running"
+                if self._profile:
+                    r["t_dispatched"] = time.monotonic_ns()
+
+        with self._evallock:
+            for r in queued:
+                self.evaluate(r)
 
     def evaluate(self, r):
         """ Evaluator for FFCavPh"""
         # 1. Obtain the total (nuclear + photonic) position arrary
         q = r["pos"]
         rvecs = r["cell"][0]
-        # assuming primitive cubic cell
-        rvecs_nparray = np.array(rvecs)
+        # assuming primitive cubic cell. the string passed to the drivers is slow
+        # to build, and the cell hardly ever changes, so it is only rebuilt when needed
         #self.cell_length = rvecs[0][0]
-        self.cell_length = np.array2string(rvecs_nparray)
+        if self._cell_rvecs is None or not np.array_equal(rvecs, self._cell_rvecs):
+            self._cell_rvecs = np.array(rvecs)
+            self.cell_length = np.array2string(self._cell_rvecs)
 
         if self.apply_photon:
             # 2.1 Separate nuclear and photonic positions
@@ -1587,16 +2383,17 @@ class FFCavPh(ForceField):
             self.photons.update_pos(q[-3*self.photons.nphoton:])
 
             # 2.2 For molecular part, evaluate forces and dipole derivatives
-            e, mf, dipole_x_tot, dipole_y_tot, dipole_z_tot, dipder_splitted = self.calc_bare_nuclear_force_dipder(q)
+            e, mf, mu, dipder = self.calc_bare_nuclear_force_dipder(q)
             # if anything wrong occurs in the evaluation, self.error_flag will become true
             # so we try to re-evaluate the forces
             count_retry = 0
             while self.error_flag == True:
                 print("Error detected in getting gradients, try to rerun SCF...")
-                e, mf, dipole_x_tot, dipole_y_tot, dipole_z_tot, dipder_splitted = self.calc_bare_nuclear_force_dipder(q)
+                e, mf, mu, dipder = self.calc_bare_nuclear_force_dipder(q)
                 count_retry += 1
                 if (count_retry >= 50):
                     softexit.trigger("Error always detected in obtaining gradients, try to shutdown simulation...")
+            dipole_x_tot, dipole_y_tot, dipole_z_tot = mu
             info("mux = %.6f muy = %.6f muz = %.6f [units of a.u.]" %(dipole_x_tot, dipole_y_tot, dipole_z_tot), verbosity.medium)
 
             # 2.3 Evaluate photonic energy (the same as FFCavPhSocket)
@@ -1612,22 +2409,36 @@ class FFCavPh(ForceField):
             #mf[0::3] += - (Ex + self.photons.coeff_self * dipole_x_tot)  * dmudx
             #mf[1::3] += - (Ey + self.photons.coeff_self * dipole_y_tot)  * dmudy
             # quantum code has cross terms dmu_i/dj (i, j=x,y,z)
-            dmuxdx, dmuydx, dmuxdy, dmuydy, dmuxdz, dmuydz = dipder_splitted
-            ph_x_coeff = Ex + self.photons.coeff_self * dipole_x_tot
-            ph_y_coeff = Ey + self.photons.coeff_self * dipole_y_tot
-            mf[0::3] += - ph_x_coeff  * dmuxdx - ph_y_coeff  * dmuydx
-            mf[1::3] += - ph_x_coeff  * dmuxdy - ph_y_coeff  * dmuydy
-            mf[2::3] += - ph_x_coeff  * dmuxdz - ph_y_coeff  * dmuydz
-
-            # 2.5. Calculate photonic force
-            f_photon = self.photons.calc_photon_force(dipole_x_tot, dipole_y_tot)
-
-            # 2.5.1 Update if adding external electric fields on the photonic DoFs
+            # contracts the dipole component axis of dipder, see calc_bare_nuclear_force_dipder
+            # the contraction is written in a scratch buffer that is kept across steps
+            ph_coeff = self._ph_coeff
+            ph_coeff[0] = Ex + self.photons.coeff_self * dipole_x_tot
+            ph_coeff[1] = Ey + self.photons.coeff_self * dipole_y_tot
+            f_cav = self._fcav_buf
+            if f_cav is None or f_cav.shape != dipder.shape[:2]:
+                f_cav = np.empty(dipder.shape[:2])
+                self._fcav_buf = f_cav
+            mf3 = mf.reshape((-1, 3))
+            mf3 -= np.dot(dipder, ph_coeff, out=f_cav)
+
+            # 2.5. The two forces are merged in an output buffer that is reused for
+            # each bead (request id). The previous forces of a bead have been
+            # copied out by the time it is evaluated again.
+            n_nuc = mf.size
+            n_full = n_nuc + self.photons.pos.size
+            mf_full = self._result_bufs.get(r["id"])
+            if mf_full is None or mf_full.size != n_full:
+                mf_full = np.empty(n_full, float)
+                self._result_bufs[r["id"]] = mf_full
+            mf_full[:n_nuc] = mf
+
+            # 2.6. Calculate photonic force, directly in its part of the output
+            f_photon = self.photons.calc_photon_force(dipole_x_tot, dipole_y_tot, out=mf_full[n_nuc:])
+
+            # 2.6.1 Update if adding external electric fields on the photonic DoFs
             self.photons.add_pulse(f_photon)
             self.photons.add_cw(f_photon, phase=None)
-
-            # 2.6. Merge the two forces
-            mf = np.concatenate((mf[:], f_photon[:]))
+            mf = mf_full
         else:
             # 2. Performing conventional energy and force evaluation
             e, mf = self.calc_bare_nuclear_force(q)
@@ -1645,57 +2456,54 @@ class FFCavPh(ForceField):
         self.iter += 1
         r["result"] = [e, mf, np.zeros((3, 3), float), ""]
         r["status"] = "Done"
-        r["t_finished"] = time.time()
+        if self._profile:
+            r["t_finished"] = time.monotonic_ns()
 
     def calc_bare_nuclear_force(self, q):
         if self.name == "psi4" and self.n_independent_bath == 1:
             import psi4
-            psi4.set_num_threads(self.nthread)
             # update positions for molecules
-            self.molec.set_geometry(psi4.core.Matrix.from_array(q.reshape((-1, 3))))
+            self._set_psi4_geometry(q)
             E, wfn = psi4.energy(self.grad_method, return_wfn=True, molecule=self.molec)
             g, wfn2 = psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec, return_wfn=True)
-            force = -np.asarray(g)
-            return E, force.flatten()
+            force = -g.np
+            return E, force.ravel()
         elif self.name == "psi4" and self.n_independent_bath > 1:
             import psi4
-            psi4.set_num_threads(self.nthread)
             # update positions for molecules with independent baths approximation
             E_tot = 0.0
-            force_lst = []
+            # the forces of the baths are written in place, in a new array as it is returned
+            force = np.empty((self.n_independent_bath, self.nat_idb, 3))
             #print("- Total atomic coordinate is\n", q)
             for idx_idb in range(self.n_independent_bath):
                 q_sub = q[int(idx_idb * self.nat_idb * 3):int((idx_idb+1) * self.nat_idb * 3)]
                 #print("--- local q coordinate is\n", q_sub)
-                self.molec.set_geometry(psi4.core.Matrix.from_array(q_sub.reshape((-1, 3))))
+                self._set_psi4_geometry(q_sub)
                 E, wfn = psi4.energy(self.grad_method, return_wfn=True, molecule=self.molec)
-                force = -np.asarray(psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec))
+                np.negative(psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec).np, out=force[idx_idb])
 
                 E_tot += E
-                force_lst.append(force)
                 #print(" --- evaluating No.%d independent bath" %self.n_independent_bath)
                 #print(" --- energy is %.7f" %E)
-                #print(" --- force is\n", force)
+                #print(" --- force is\n", force[idx_idb])
 
-            force = np.array(force_lst).flatten()
+            force = force.ravel()
             #print("- Final combined energy is %.7f" %E_tot)
             #print("- Final combined force is\n", force)
             return E_tot, force
         elif self.name == "run_qe_driver.sh" and self.n_independent_bath == 1:
             # 1. we construct a string "ATOM1 x y z\n ATOM2 x y z\n ..."
-            total_str = ""
-            for idx in range(len(self.atom_label_lst)):
-                local_str = "%s %.6f %.6f %.6f\n" %(self.atom_label_lst[idx], q[idx*3], q[idx*3+1], q[idx*3+2])
-                total_str += local_str
+            total_str = self._driver_geometry(q, 0, len(self.atom_label_lst), 6)
             #print("Use %s to evaluate the following molecular geometry:" %self.name)
             #print(total_str)
-            bashCommand = "./" + self.name + ", %s" %total_str + ", %s" %self.cell_length + " ,phonon_no"
+            # the arguments are passed to the driver script as they are, without a shell
+            args = ["./" + self.name, " " + total_str, " " + self.cell_length + " ", "phonon_no"]
             import subprocess
-            process = subprocess.Popen(bashCommand.split(","), stdout=subprocess.PIPE)
+            process = subprocess.Popen(args, stdout=subprocess.PIPE)
             output, error = process.communicate()
             # read data from local file
-            E = np.loadtxt("IPI_DRIVER_TEMP/energy.ry") * 0.5
-            force = np.loadtxt("IPI_DRIVER_TEMP/force.ry_au") * 0.5
+            E = _read_table("IPI_DRIVER_TEMP/energy.ry") * 0.5
+            force = _read_table("IPI_DRIVER_TEMP/force.ry_au") * 0.5
             force  = force.flatten()
             return E, force
         elif ("run_qc_driver" in self.name) and self.n_independent_bath >= 1:
@@ -1704,88 +2512,72 @@ class FFCavPh(ForceField):
             for idx_idb in range(self.n_independent_bath):
                 IPI_DRIVER_TEMP = "IPI_DRIVER_TEMP_%d" %(idx_idb+1)
                 # 1. we construct a string "ATOM1 x y z\n ATOM2 x y z\n ..."
-                total_str = ""
-                idx_start = idx_idb * self.nat_idb
-                for idx in range(self.nat_idb):
-                    local_str = "%s %.8f %.8f %.8f\n" %(self.atom_label_lst[idx+idx_start], q[(idx+idx_start)*3], q[(idx+idx_start)*3+1], q[(idx+idx_start)*3+2])
-                    total_str += local_str
+                total_str = self._driver_geometry_arg(q, idx_idb, 8)
                 #print("Use %s to evaluate the following molecular geometry:" %self.name)
                 #print(total_str)
 
-                bashCommand = "./" + self.name + ",%s" %total_str + ",%s" %self.cell_length + ",dipder_no" + ",%s" %IPI_DRIVER_TEMP
+                args = ["./" + self.name, total_str, self.cell_length, "dipder_no", IPI_DRIVER_TEMP]
                 if self.do_qmmm:
-                    bashCommand += ",qmmm_yes"
-                #print("final bash command is")
-                #print(bashCommand)
-                #print("splitted command is")
-                #print(bashCommand.split(","))
-                process = subprocess.Popen(bashCommand.split(","), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    args.append("qmmm_yes")
+                # the previous potential files are removed before the driver can write the new ones
+                for fname in ("energy.au", "egrad.au"):
+                    path = "%s/%s" %(IPI_DRIVER_TEMP, fname)
+                    if os.path.exists(path):
+                        os.remove(path)
+                process = self._start_driver(idx_idb, args, stderr=subprocess.PIPE)
                 processes.append(process)
                 #print("processes are", processes)
-                try:
-                    os.remove("%s/energy.au" %IPI_DRIVER_TEMP)
-                    os.remove("%s/egrad.au" %IPI_DRIVER_TEMP)
-                except:
-                    None
 
             # run command
             #output = [p.wait() for p in processes]
-            output = [p.communicate() for p in processes]
+            try:
+                output = _communicate_all(processes)
+            except (OSError, RuntimeError) as e:
+                print("Error occurs when running the drivers: %s" %e)
+                self.error_flag = True
+                return 0, 0
             #print("output is", output)
 
             E_tot = 0.0
-            force_lst = []
-            mux_tot, muy_tot, muz_tot = 0.0, 0.0, 0.0
+            # the forces of each bath go straight to their slice of the returned array
+            force_all = np.empty((self.n_independent_bath, self.nat_idb * 3))
+            mu_tot = np.zeros(3)
             for idx_idb in range(self.n_independent_bath):
                 IPI_DRIVER_TEMP = "IPI_DRIVER_TEMP_%d" %(idx_idb+1)
                 # read data from local file
                 try:
-                    E = np.loadtxt("%s/energy.au" %IPI_DRIVER_TEMP)
-                    force = np.loadtxt("%s/egrad.au" %IPI_DRIVER_TEMP)
-                    mu_info = np.loadtxt("%s/dipole.debye" %IPI_DRIVER_TEMP)
-                except:
+                    E = _read_table("%s/energy.au" %IPI_DRIVER_TEMP)
+                    force = _read_table("%s/egrad.au" %IPI_DRIVER_TEMP)
+                    mu_info = _read_table("%s/dipole.debye" %IPI_DRIVER_TEMP)
+                except (OSError, ValueError):
                     print("Error occurs when reading files from %s" %IPI_DRIVER_TEMP)
                     self.error_flag = True
                     return 0, 0
                 # check if there is anything wrong for this simulation
-                try:
-                    if force.size == self.nat_idb*3 and E.size == 1 and mu_info.size == 3:
-                        self.error_flag = False
-                    else:
-                        self.error_flag = True
-                        return 0, 0
-                except:
+                if force.size != self.nat_idb*3 or E.size != 1 or mu_info.size != 3:
                     print("Error occurs when evaluating the dimensions of the files")
-                    return 0, 0
                     self.error_flag = True
+                    return 0, 0
                 #print("coordinate is ")
                 #print(q)
                 if not self.do_qmmm:
-                    force  = -1.0 * np.transpose(force).flatten()
-                else:
-                    force  = -1.0 * force.flatten()
+                    force = np.transpose(force)
+                force = np.negative(force, out=force_all[idx_idb].reshape(force.shape))
                 #print("- Energy is %.10f" %E)
                 #print("- Force is")
                 #print(force)
-                mux, muy, muz = mu_info
-                mux *= self.Debye2AU
-                muy *= self.Debye2AU
-                muz *= self.Debye2AU
-
                 E_tot += E
-                force_lst.append(force)
-                mux_tot += mux
-                muy_tot += muy
-                muz_tot += muz
-
-            force = np.array(force_lst).flatten()
-            print("mux = %.6f muy = %.6f muz = %.6f [units of a.u.]" %(mux_tot, muy_tot, muz_tot))
-            self.error_flag == False
+                mu_tot += mu_info
+
+            force = force_all.ravel()
+            mu_tot *= self.Debye2AU
+            print("mux = %.6f muy = %.6f muz = %.6f [units of a.u.]" %tuple(mu_tot))
+            self.error_flag = False
             return E_tot, force
         elif self.name == "qchem-neo" and self.n_independent_bath == 1:
             qchem_input_filename = self.qchem_template + ".in"
             qchem_output_filename = self.qchem_template + ".out"
-            self.construct_qchem_input(q * self.AU2Angstrom, qchem_input_filename)
+            self.construct_qchem_input(q[:3*self.nat] * self.AU2Angstrom, qchem_input_filename)
             # run this qchem file
             import subprocess
             bashCommand = ["qchem", "-nt", "%d" %self.nthread, qchem_input_filename]
@@ -1793,11 +2585,11 @@ class FFCavPh(ForceField):
             process.communicate()
             # after running this command, get energy and gradients
             try:
-                E = np.loadtxt("./current_state.e")
-                force = np.loadtxt("./current_state.grad").transpose()
-                mue_info = np.loadtxt("./current_state.dipole_e")
-                mun_info = np.loadtxt("./current_state.dipole_n")
-            except:
+                E = _read_table("./current_state.e")
+                force = _read_table("./current_state.grad").transpose()
+                mue_info = _read_table("./current_state.dipole_e")
+                mun_info = _read_table("./current_state.dipole_n")
+            except (OSError, ValueError):
                 print("Error occurs when reading files")
                 self.error_flag = True
                 return 0, 0
@@ -1807,307 +2599,248 @@ class FFCavPh(ForceField):
             print("muex = %.6f muey = %.6f muez = %.6f [units of a.u.]" %(mue_info[0], mue_info[1], mue_info[2]))
             print("munx = %.6f muny = %.6f munz = %.6f [units of a.u.]" %(mun_info[0], mun_info[1], mun_info[2]))
             return E,  force
+    def _set_psi4_geometry(self, q):
+        """Updates the geometry of the psi4 molecule, copying the positions in
+        the preallocated psi4 matrix rather than creating a new one."""
+
+        self._psi4_geom.np[:] = q.reshape((-1, 3))
+        self.molec.set_geometry(self._psi4_geom)
+
+    def _get_bath_charges(self):
+        """Returns the fixed partial charges of the first atoms of a bath, QM
+        atoms first, as in the positions. Uncharged MM atoms are left out."""
+
+        if self._bath_charges is None:
+            if self._mm_charged:
+                self._bath_charges = np.concatenate((self.qm_charge_array, self.mm_charge_array))
+            else:
+                self._bath_charges = self.qm_charge_array
+        return self._bath_charges
+
+    def _get_qm_charge_dipder(self, nbath=1):
+        """Returns the dipole derivatives given by the fixed QM partial charges,
+        which are the same for all the baths and steps, as a read-only array.
+
+        Args:
+           nbath: The number of baths the derivatives are stacked for.
+        """
+
+        dipder = self._qm_charge_dipder.get(nbath)
+        if dipder is None:
+            dipder = _charge_dipder(np.tile(self.qm_charge_array, nbath))
+            self._qm_charge_dipder[nbath] = dipder
+        return dipder
+
+    def _get_mm_charge_dipder(self):
+        """Returns the dipole derivatives given by the MM partial charges, as
+        a read-only array."""
+
+        if self._mm_charge_dipder is None:
+            self._mm_charge_dipder = _charge_dipder(self.mm_charge_array)
+        return self._mm_charge_dipder
+
     def calc_bare_nuclear_force_dipder(self, q):
+        """Evaluates the energy, forces, dipole and dipole derivatives of the
+        molecules with the chosen ab initio code.
+
+        Args:
+           q: The nuclear positions.
+
+        Returns:
+           The energy, the flat forces, the total dipole as a 3-vector and
+           the dipole derivatives as a (nat, 3, 3) array, whose
+           [i, j, k] element is the derivative of the k-th dipole component
+           along the j-th coordinate of atom i. If the evaluation fails,
+           zeros are returned and error_flag is set.
+        """
+
         if self.name == "psi4" and self.n_independent_bath == 1:
             import psi4
-            psi4.set_num_threads(self.nthread)
             # update positions for molecules
-            self.molec.set_geometry(psi4.core.Matrix.from_array(q.reshape((-1, 3))))
+            self._set_psi4_geometry(q)
             E, wfn = psi4.energy(self.grad_method, return_wfn=True, molecule=self.molec)
             # evaluate total dipole moment
             try:
                 # depending on the version of psi4
-                mux, muy, muz = psi4.core.variable('SCF DIPOLE')
-            except:
-                mux = psi4.core.variable('SCF DIPOLE X') * self.Debye2AU
-                muy = psi4.core.variable('SCF DIPOLE Y') * self.Debye2AU
-                muz = psi4.core.variable('SCF DIPOLE Z') * self.Debye2AU
-            force = -np.asarray(psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec))
+                mu = np.array(psi4.core.variable('SCF DIPOLE'), float).reshape(3)
+            except Exception:
+                mu = np.array([psi4.core.variable('SCF DIPOLE %s' %x) for x in "XYZ"]) * self.Debye2AU
+            force = -psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec).np
             if self.qm_charge_array.size > 0:
-                dmuxdx = self.qm_charge_array
-                dmuydx = np.zeros(self.qm_charge_array.size)
-                dmuxdy = np.zeros(self.qm_charge_array.size)
-                dmuydy = self.qm_charge_array
-                dmuxdz = np.zeros(self.qm_charge_array.size)
-                dmuydz = np.zeros(self.qm_charge_array.size)
+                dipder = self._get_qm_charge_dipder()
             else:
                 H, wfn2 = psi4.hessian(self.grad_method, return_wfn=True, ref_wfn=wfn)
                 dipder = wfn2.variable('SCF DIPOLE GRADIENT').np
-                # importantly, I need to split diper array to the desired ones
-                dmuxdx = dipder[0::3,0]
-                dmuydx = dipder[0::3,1]
-                dmuxdy = dipder[1::3,0]
-                dmuydy = dipder[1::3,1]
-                dmuxdz = dipder[2::3,0]
-                dmuydz = dipder[2::3,1]
-            dipder_splitted = (dmuxdx, dmuydx, dmuxdy, dmuydy, dmuxdz, dmuydz)
 
             # check the validity of the output values [be very careful]
-            #print("dipole x", mux)
-            #print("dipole y", muy)
+            #print("dipole", mu)
             #print("original dipder array")
             #print(dipder)
-            #print("dmuxdx")
-            #print(dmuxdx)
-            #print("dmuydx")
-            #print(dmuydx)
-            #print("dmuxdy")
-            #print(dmuxdy)
-            #print("dmuydy")
-            #print(dmuydy)
-            #print("dmuxdz")
-            #print(dmuxdz)
-            #print("dmuydz")
-            #print(dmuydz)
-
-            return E, force.flatten(), mux, muy, muz, dipder_splitted
+
+            return E, force.ravel(), mu, dipder.reshape((-1, 3, 3))
         elif self.name == "psi4" and self.n_independent_bath > 1:
             import psi4
-            psi4.set_num_threads(self.nthread)
             # update positions for molecules with independent baths approximation
             E_tot = 0.0
-            force_lst = []
-            mux_tot, muy_tot, muz_tot = 0.0, 0.0, 0.0
-            dipder_lst = []
+            # the forces of the baths are written in place, in a new array as it is returned.
+            # the dipole derivatives are used right away by evaluate, so their buffer is reused
+            force = np.empty((self.n_independent_bath, self.nat_idb, 3))
+            mu_tot = np.zeros(3)
+            if self._dipder_buf is None and self.qm_charge_array.size == 0:
+                self._dipder_buf = np.empty((self.n_independent_bath, self.nat_idb * 3, 3))
+            dipder_all = self._dipder_buf
             #print("- Total atomic coordinate is\n", q)
             for idx_idb in range(self.n_independent_bath):
                 q_sub = q[int(idx_idb * self.nat_idb * 3):int((idx_idb+1) * self.nat_idb * 3)]
                 #print("--- local q coordinate is\n", q_sub)
-                self.molec.set_geometry(psi4.core.Matrix.from_array(q_sub.reshape((-1, 3))))
+                self._set_psi4_geometry(q_sub)
                 E, wfn = psi4.energy(self.grad_method, return_wfn=True, molecule=self.molec)
                 # evaluate total dipole moment
                 try:
                     # depending on the version of psi4
                     mux, muy, muz = psi4.core.variable('SCF DIPOLE')
-                except:
+                except Exception:
                     mux = psi4.core.variable('SCF DIPOLE X') * self.Debye2AU
                     muy = psi4.core.variable('SCF DIPOLE Y') * self.Debye2AU
                     muz = psi4.core.variable('SCF DIPOLE Z') * self.Debye2AU
-                force = -np.asarray(psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec))
-
-                if self.qm_charge_array.size > 0:
-                    nsize = int(self.qm_charge_array.size * 3)
-                    dipder = np.zeros((nsize, 3))
-                    dipder[0::3,0] = self.qm_charge_array
-                    dipder[1::3,1] = self.qm_charge_array
-                    dipder[2::3,2] = self.qm_charge_array
-                else:
+                np.negative(psi4.gradient(self.grad_method, ref_wfn=wfn, molecule=self.molec).np, out=force[idx_idb])
+
+                # with fixed charges, the derivatives of all the baths are built just once below
+                if self.qm_charge_array.size == 0:
                     H, wfn2 = psi4.hessian(self.grad_method, return_wfn=True, ref_wfn=wfn)
-                    dipder = wfn2.variable('SCF DIPOLE GRADIENT').np
+                    dipder_all[idx_idb] = wfn2.variable('SCF DIPOLE GRADIENT').np
                 E_tot += E
-                mux_tot += mux
-                muy_tot += muy
-                muz_tot += muz
-                force_lst.append(force)
-                dipder_lst.append(dipder)
+                mu_tot += (mux, muy, muz)
                 #print(" --- evaluating No.%d independent bath" %self.n_independent_bath)
                 #print(" --- energy is %.7f" %E)
-                #print(" --- force is\n", force)
-                #print(" --- dipder is\n", dipder)
+                #print(" --- force is\n", force[idx_idb])
 
-            force = np.array(force_lst).flatten()
-            dipder = np.array(dipder_lst).reshape(-1, 3)
+            force = force.ravel()
+            if self.qm_charge_array.size > 0:
+                dipder = self._get_qm_charge_dipder(self.n_independent_bath)
+            else:
+                dipder = dipder_all.reshape(-1, 3)
             #print("- Final combined energy is %.7f" %E_tot)
             #print("- Final combined force is\n", force)
             #print("- Final combined dipder is\n", dipder)
-            # importantly, I need to split diper array to the desired ones
-            dmuxdx = dipder[0::3,0]
-            dmuydx = dipder[0::3,1]
-            dmuxdy = dipder[1::3,0]
-            dmuydy = dipder[1::3,1]
-            dmuxdz = dipder[2::3,0]
-            dmuydz = dipder[2::3,1]
-            dipder_splitted = (dmuxdx, dmuydx, dmuxdy, dmuydy, dmuxdz, dmuydz)
-
-            return E_tot, force, mux_tot, muy_tot, muz_tot, dipder_splitted
+
+            return E_tot, force, mu_tot, dipder.reshape((-1, 3, 3))
         elif self.name == "run_qe_driver.sh" and self.n_independent_bath == 1:
             # 1. we construct a string "ATOM1 x y z\n ATOM2 x y z\n ..."
-            total_str = ""
-            for idx in range(len(self.atom_label_lst)):
-                local_str = "%s %.6f %.6f %.6f\n" %(self.atom_label_lst[idx], q[idx*3], q[idx*3+1], q[idx*3+2])
-                total_str += local_str
+            total_str = self._driver_geometry(q, 0, len(self.atom_label_lst), 6)
             #print("Use %s to evaluate the following molecular geometry:" %self.name)
             #print(total_str)
-            bashCommand = "./" + self.name + ", %s" %total_str + ", %s" %self.cell_length + " ,phonon_yes"
+            args = ["./" + self.name, " " + total_str, " " + self.cell_length + " ", "phonon_yes"]
             import subprocess
-            process = subprocess.Popen(bashCommand.split(","), stdout=subprocess.PIPE)
+            process = subprocess.Popen(args, stdout=subprocess.PIPE)
             output, error = process.communicate()
             # read data from local file
-            E = np.loadtxt("IPI_DRIVER_TEMP/energy.ry") * 0.5
-            force = np.loadtxt("IPI_DRIVER_TEMP/force.ry_au") * 0.5
+            E = _read_table("IPI_DRIVER_TEMP/energy.ry") * 0.5
+            force = _read_table("IPI_DRIVER_TEMP/force.ry_au") * 0.5
             force  = force.flatten()
 
-            mux, muy, muz = np.loadtxt("IPI_DRIVER_TEMP/dipole.au")
-            Qx = np.loadtxt("IPI_DRIVER_TEMP/Qx")
-            Qy = np.loadtxt("IPI_DRIVER_TEMP/Qy")
-            Qz = np.loadtxt("IPI_DRIVER_TEMP/Qz")
-            dmuxdx = Qx[:,0]
-            dmuydx = Qy[:,0]
-            dmuxdy = Qx[:,1]
-            dmuydy = Qy[:,1]
-            dmuxdz = Qx[:,2]
-            dmuydz = Qy[:,2]
-            dipder_splitted = (dmuxdx, dmuydx, dmuxdy, dmuydy, dmuxdz, dmuydz)
-            return E, force, mux, muy, muz, dipder_splitted
+            mu = _read_table("IPI_DRIVER_TEMP/dipole.au")
+            Qx = _read_table("IPI_DRIVER_TEMP/Qx")
+            Qy = _read_table("IPI_DRIVER_TEMP/Qy")
+            Qz = _read_table("IPI_DRIVER_TEMP/Qz")
+            # Qx[i, j] is the derivative of mux along the j-th coordinate of atom i
+            return E, force, mu, np.stack((Qx, Qy, Qz), axis=-1)
         elif ("run_qc_driver" in self.name) and self.n_independent_bath >= 1:
             import subprocess
             processes = []
             for idx_idb in range(self.n_independent_bath):
                 IPI_DRIVER_TEMP = "IPI_DRIVER_TEMP_%d" %(idx_idb+1)
                 # 1. we construct a string "ATOM1 x y z\n ATOM2 x y z\n ..."
-                total_str = ""
-                idx_start = idx_idb * self.nat_idb
-                for idx in range(self.nat_idb):
-                    local_str = "%s %.8f %.8f %.8f\n" %(self.atom_label_lst[idx+idx_start], q[(idx+idx_start)*3], q[(idx+idx_start)*3+1], q[(idx+idx_start)*3+2])
-                    total_str += local_str
+                total_str = self._driver_geometry_arg(q, idx_idb, 8)
+                if not self.binary_geometry:
+                    total_str = " " + total_str
                 #print("Use %s to evaluate the following molecular geometry:" %self.name)
                 #print(total_str)
-                bashCommand = "./" + self.name + ", %s" %total_str + ", %s" %self.cell_length + " ,dipder_yes" + ",%s" %IPI_DRIVER_TEMP
                 # If qm_charge_array has a size larger than zero, we do not perform expensive simulations
-                if self.qm_charge_array.size > 0:
-                    #print("qm_charge_array defined, skipping expensive dipder calculation")
-                    bashCommand = "./" + self.name + ", %s" %total_str + ", %s" %self.cell_length + " ,dipder_no" + ",%s" %IPI_DRIVER_TEMP
+                dipder_flag = "dipder_no" if self.qm_charge_array.size > 0 else "dipder_yes"
+                args = ["./" + self.name, total_str, " " + self.cell_length + " ", dipder_flag, IPI_DRIVER_TEMP]
                 if self.do_qmmm:
-                    bashCommand += ",qmmm_yes"
-                process = subprocess.Popen(bashCommand.split(","), stdout=subprocess.PIPE)
+                    args.append("qmmm_yes")
+                # move away the previous potential files, before the driver can write the new ones
+                for fname in ("energy.au", "egrad.au", "dipole.debye", "dipder.au"):
+                    path = "%s/%s" %(IPI_DRIVER_TEMP, fname)
+                    if os.path.exists(path):
+                        os.replace(path, path + ".last_step")
+                process = self._start_driver(idx_idb, args)
                 processes.append(process)
-                # Finally, try to remove the previous potential files
-                try:
-                    #os.remove("%s/energy.au" %IPI_DRIVER_TEMP)
-                    #os.remove("%s/egrad.au" %IPI_DRIVER_TEMP)
-                    #os.remove("%s/dipole.debye" %IPI_DRIVER_TEMP)
-                    #os.remove("%s/dipder.au" %IPI_DRIVER_TEMP)
-                    os.rename("%s/energy.au" %IPI_DRIVER_TEMP, "%s/energy.au.last_step" %IPI_DRIVER_TEMP)
-                    os.rename("%s/egrad.au" %IPI_DRIVER_TEMP, "%s/egrad.au.last_step" %IPI_DRIVER_TEMP)
-                    os.rename("%s/dipole.debye" %IPI_DRIVER_TEMP, "%s/dipole.debye.last_step" %IPI_DRIVER_TEMP)
-                    os.rename("%s/dipder.au" %IPI_DRIVER_TEMP, "%s/dipder.au.last_step" %IPI_DRIVER_TEMP)
-                except:
-                    None
 
             # run command
-            output = [p.communicate() for p in processes]
+            try:
+                output = _communicate_all(processes)
+            except (OSError, RuntimeError) as e:
+                print("Error occurs when running the drivers: %s" %e)
+                self.error_flag = True
+                return 0, 0, 0, 0
 
             E_tot = 0.0
-            force_lst = []
-            mux_tot, muy_tot, muz_tot = 0.0, 0.0, 0.0
-            dipder_lst = []
-            for idx_idb in range(self.n_independent_bath):
+            # the forces of each bath go straight to their slice of the returned array
+            force_all = np.empty((self.n_independent_bath, self.nat_idb * 3))
+            # the sizes and charges are the same for all the baths. with QM/MM, the drivers
+            # only return the dipole derivatives of the QM atoms
+            nbath = self.n_independent_bath
+            do_qmmm = self.do_qmmm
+            nat_idb = self.nat_idb
+            n_qm = self.n_qm_atom if do_qmmm else nat_idb
+            qm_charges = self.qm_charge_array
+            fixed_charges = qm_charges.size > 0
+            # the dipole derivatives of all baths are written in a buffer that is used right away
+            # by evaluate. the rows of the MM atoms, and with fixed charges those of the QM atoms,
+            # never change and are only set once
+            if self._dipder_buf is None:
+                self._dipder_buf = np.zeros((nbath, nat_idb * 3, 3))
+                if self._mm_charged:
+                    self._dipder_buf[:, n_qm*3:] = self._get_mm_charge_dipder()
+                if fixed_charges:
+                    self._dipder_buf[:, :n_qm*3] = self._get_qm_charge_dipder()
+            dipder_all = self._dipder_buf
+            q_baths = q[:nbath * nat_idb * 3].reshape((nbath, nat_idb, 3))
+            # the loop over the baths only reads the driver outputs. the forces are negated
+            # and the dipoles summed for all the baths at once afterwards
+            mu_baths = None if fixed_charges else np.empty((nbath, 3))
+            for idx_idb in range(nbath):
                 IPI_DRIVER_TEMP = "IPI_DRIVER_TEMP_%d" %(idx_idb+1)
                 # read data from local file
                 try:
-                    E = np.loadtxt("%s/energy.au" %IPI_DRIVER_TEMP)
-                    force = np.loadtxt("%s/egrad.au" %IPI_DRIVER_TEMP)
-                    if self.qm_charge_array.size == 0:
-                        #print("qm_charge_array not defined, reading dipder from file")
-                        mu_info = np.loadtxt("%s/dipole.debye" %IPI_DRIVER_TEMP)
-                        dipder = np.loadtxt("%s/dipder.au" %IPI_DRIVER_TEMP)
-                    else:
-                        #print("qm_charge_array defined, calculating dipder automatically")
-                        idx_start = idx_idb * self.nat_idb
-                        if self.do_qmmm:
-                            q_sub = q[(idx_start)*3 : (idx_start + self.nat_idb)*3]
-                            q_qm = q_sub[:self.n_qm_atom*3]
-                        else:
-                            q_qm = q[idx_start*3:(idx_start + self.nat_idb)*3]
-                        mux = np.sum(self.qm_charge_array * q_qm[0::3])
-                        muy = np.sum(self.qm_charge_array * q_qm[1::3])
-                        muz = np.sum(self.qm_charge_array * q_qm[2::3])
-                        mu_info = np.array([mux, muy, muz]) / self.Debye2AU
-
-                        n_dipder = self.nat_idb*9
-                        if self.do_qmmm:
-                            n_dipder = self.n_qm_atom * 9
-                        dipder = np.zeros(n_dipder).reshape(-1, 3)
-                        dipder[0::3,0] = self.qm_charge_array
-                        dipder[1::3,1] = self.qm_charge_array
-                        dipder[2::3,2] = self.qm_charge_array
-                        #print("self-calculated dipole vector is", mu_info)
-                        #print("self-calculated dipder info is", dipder)
-                except:
+                    E = _read_table("%s/energy.au" %IPI_DRIVER_TEMP)
+                    force = _read_table("%s/egrad.au" %IPI_DRIVER_TEMP)
+                    if not fixed_charges:
+                        mu_info = _read_table("%s/dipole.debye" %IPI_DRIVER_TEMP)
+                        dipder = _read_table("%s/dipder.au" %IPI_DRIVER_TEMP)
+                except (OSError, ValueError):
                     print("Error occurs when reading files from %s" %IPI_DRIVER_TEMP)
                     self.error_flag = True
-                    return 0, 0, 0, 0, 0, 0
+                    return 0, 0, 0, 0
                 # check if there is anything wrong for this simulation
-                n_dipder = self.nat_idb*9
-                if self.do_qmmm:
-                    n_dipder = self.n_qm_atom * 9
-                try:
-                    if force.size == self.nat_idb*3 and E.size == 1 and dipder.size == n_dipder and mu_info.size == 3:
-                        self.error_flag = False
-                    else:
-                        self.error_flag = True
-                        return 0, 0, 0, 0, 0, 0
-                except:
+                if force.size != nat_idb*3 or E.size != 1 or (not fixed_charges and (dipder.size != n_qm*9 or mu_info.size != 3)):
                     print("Error occurs when evaluating the dimensions of the files")
-                    return 0, 0, 0, 0, 0, 0
                     self.error_flag = True
-                #print("coordinate is ")
-                #print(q)
-                #print("- Before treatment force is")
-                #print(force)
-                if not self.do_qmmm:
-                    force  = -1.0 * np.transpose(force).flatten()
-                else:
-                    force  = -1.0 * force.flatten()
-                #print("- Energy is %.10f" %E)
-                #print("- Force is")
-                #print(force)
-                mux, muy, muz = mu_info
-                mux *= self.Debye2AU
-                muy *= self.Debye2AU
-                muz *= self.Debye2AU
-                #print("dipder is")
-                #print(dipder)
-
-                if self.do_qmmm:
-                    #print("Appending MM partial charges to molecular dipole moment")
-                    idx_start = idx_idb * self.nat_idb
-                    q_sub = q[(idx_start)*3 : (idx_start + self.nat_idb)*3]
-                    #print("molecular coordinate is: ", q_sub)
-                    q_sub_mm = q_sub[self.n_qm_atom*3:]
-                    #print("MM molecules are:", q_sub_mm)
-                    mux_mm = np.sum(q_sub_mm[0::3] * self.mm_charge_array)
-                    muy_mm = np.sum(q_sub_mm[1::3] * self.mm_charge_array)
-                    muz_mm = np.sum(q_sub_mm[2::3] * self.mm_charge_array)
-                    #print("QMsub mux = %.3f, muy = %.3f, muz = %.3f" %(mux, muy, muz))
-                    #print("MMsub mux = %.3f, muy = %.3f, muz = %.3f" %(mux_mm, muy_mm, muz_mm))
-                    mux += mux_mm
-                    muy += muy_mm
-                    muz += muz_mm
-                    #print("QM+MM mux = %.3f, muy = %.3f, muz = %.3f" %(mux, muy, muz))
-                    #print("Appending MM partial charges to molecular dipole derivatives")
-                    #print("QMsub dipder = ")
-                    #print(dipder)
-                    #print("MMsub dipder = ")
-                    dipder_mm = np.zeros((self.n_mm_atom*3, 3))
-                    dipder_mm[0::3,0] = self.mm_charge_array # dmux/dx
-                    dipder_mm[1::3,1] = self.mm_charge_array # dmuy/dy
-                    dipder_mm[2::3,2] = self.mm_charge_array # dmuz/dz
-                    #print(dipder_mm)
-                    #print("QM+MM dipder = ")
-                    dipder = np.concatenate((dipder, dipder_mm))
-                    #print(dipder)
-                    #print("QM+MM forces = ")
-                    #print(force)
+                    return 0, 0, 0, 0
+                if not do_qmmm:
+                    force = np.transpose(force)
+                force_all[idx_idb].reshape(force.shape)[:] = force
+                if not fixed_charges:
+                    mu_baths[idx_idb] = mu_info
+                    dipder_all[idx_idb, :n_qm*3] = dipder.reshape((-1, 3))
 
                 E_tot += E
-                mux_tot += mux
-                muy_tot += muy
-                muz_tot += muz
-                force_lst.append(force)
-                dipder_lst.append(dipder)
-
-            force = np.array(force_lst).flatten()
-            dipder = np.array(dipder_lst).reshape(-1, 3)
-            #print("The final dipder is")
-            #print(dipder)
-            # importantly, I need to split diper array to the desired ones
-            dmuxdx = dipder[0::3,0]
-            dmuydx = dipder[0::3,1]
-            dmuxdy = dipder[1::3,0]
-            dmuydy = dipder[1::3,1]
-            dmuxdz = dipder[2::3,0]
-            dmuydz = dipder[2::3,1]
-            dipder_splitted = (dmuxdx, dmuydx, dmuxdy, dmuydy, dmuxdz, dmuydz)
+
+            np.negative(force_all, out=force_all)
+            if fixed_charges:
+                # with fixed charges, the dipoles of all the baths (QM and MM atoms together)
+                # are a single contraction of the charges with the positions
+                bath_charges = self._get_bath_charges()
+                mu_tot = np.matmul(bath_charges, q_baths[:, :bath_charges.size]).sum(axis=0)
+            else:
+                mu_tot = mu_baths.sum(axis=0) * self.Debye2AU
+                if self._mm_charged:
+                    # the MM partial charges add to the molecular dipole
+                    mu_tot += np.matmul(self.mm_charge_array, q_baths[:, n_qm:]).sum(axis=0)
+            force = force_all.ravel()
+            dipder = dipder_all.reshape(-1, 3)
             self.error_flag = False
-            return E_tot, force, mux_tot, muy_tot, muz_tot, dipder_splitted
+            return E_tot, force, mu_tot, dipder.reshape((-1, 3, 3))
@@ -165,8 +165,9 @@ class ForceBead(dobject):
         if self.request is None:
             self.request = self.queue()
 
-        # sleeps until the request has been evaluated
-        while self.request["status"] != "Done":
+        # waits until the request has been evaluated, waking up every latency
+        # seconds to check for a soft exit
+        while not (self.request.wait(self.ff.latency) and self.request["status"] == "Done"):
             if self.request["status"] == "Exit" or softexit.triggered:
                 # now, this is tricky. we are stuck here and we cannot return meaningful results.
                 # if we return, we may as well output wrong numbers, or mess up things.
@@ -176,9 +177,8 @@ class ForceBead(dobject):
                 while softexit.exiting:
                     time.sleep(self.ff.latency)
                 sys.exit()
-            time.sleep(self.ff.latency)
         # print diagnostics about the elapsed time
-        info("# forcefield %s evaluated in %f (queue) and %f (dispatched) sec." % (self.ff.name, self.request["t_finished"] - self.request["t_queued"], self.request["t_finished"] - self.request["t_dispatched"]), verbosity.debug)
+        info("# forcefield %s evaluated in %f (queue) and %f (dispatched) sec." % (self.ff.name, 1e-9 * (self.request["t_finished"] - self.request["t_queued"]), 1e-9 * (self.request["t_finished"] - self.request["t_dispatched"])), verbosity.debug)
 
         # data has been collected, so the request can be released and a slot
         # freed up for new calculations
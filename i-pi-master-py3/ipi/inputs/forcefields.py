@@ -5,7 +5,6 @@
 # See the "licenses" directory for full license information.
 
 
-from copy import copy
 import numpy as np
 
 from ipi.engine.forcefields import ForceField, FFSocket, FFLennardJones, FFDebye, FFPlumed, FFYaff, FFsGDML, FFCavPhSocket, FFCavPhFPSocket, FFCavPh
@@ -54,11 +53,10 @@ class InputForceField(Input):
                                  "default": 0.01,
                                  "help": "The number of seconds the polling thread will wait between exhamining the list of requests."}),
              "parameters": (InputValue, {"dtype": dict,
-                                         "default": {},
+                                         "default": input_default(factory=dict),
                                          "help": "The parameters of the force field"}),
              "activelist": (InputArray, {"dtype": int,
-                                         "default": np.array([-1]),
-                                         #                                     "default" : input_default(factory=np.array, args =[-1]),
+                                         "default": input_default(factory=np.array, args=([-1],)),
                                          "help": "List with indexes of the atoms that this socket is taking care of.    Default: all (corresponding to -1)"})
     }
 
@@ -80,6 +78,27 @@ class InputForceField(Input):
         self.activelist.store(ff.active)
         self.threaded.store(ff.threaded)
 
+    def _check_ranges(self, ranges):
+        """Checks that some of the fields are within their allowed range.
+
+        Args:
+           ranges: A list of tuples (field name, minimum, maximum, error message),
+              where the maximum can be None. The value replaces {} in the message.
+
+        Raises:
+           ValueError: Raised if a field is out of range.
+        """
+
+        for name, vmin, vmax, message in ranges:
+            value = self.__dict__[name].fetch()
+            if value < vmin or (vmax is not None and value > vmax):
+                raise ValueError(message.format(value))
+
+    def _socket_kwargs(self):
+        """Returns the arguments of the socket interface, see _socket_interface_kwargs."""
+
+        return {arg: self.__dict__[name].fetch() for arg, name in _socket_interface_kwargs}
+
     def fetch(self):
         """Creates a ForceField object.
 
@@ -92,6 +111,64 @@ class InputForceField(Input):
         return ForceField(pars=self.parameters.fetch(), name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(), active=self.activelist.fetch(), threaded=self.threaded.fetch())
 
 
+# the parameters of the socket interface, shared by all the socket forcefields
+_socket_fields = {"address": (InputValue, {"dtype": str,
+                                           "default": "localhost",
+                                           "help": "This gives the server address that the socket will run on."}),
+                  "port": (InputValue, {"dtype": int,
+                                        "default": 65535,
+                                        "help": "This gives the port number that defines the socket."}),
+                  "slots": (InputValue, {"dtype": int,
+                                         "default": 4,
+                                         "help": "This gives the number of client codes that can queue at any one time."}),
+                  "exit_on_disconnect": (InputValue, {"dtype": bool,
+                                                      "default": False,
+                                                      "help": "Determines if i-PI should quit when a client disconnects."}),
+                  "timeout": (InputValue, {"dtype": float,
+                                           "default": 0.0,
+                                           "help": "This gives the number of seconds before assuming a calculation has died. If 0 there is no timeout."})}
+_socket_attribs = {
+    "mode": (InputAttribute, {"dtype": str,
+                              "options": ["unix", "inet"],
+                              "default": "inet",
+                              "help": "Specifies whether the driver interface will listen onto a internet socket [inet] or onto a unix socket [unix]."}),
+    "matching": (InputAttribute, {"dtype": str,
+                                  "options": ["auto", "any"],
+                                  "default": "auto",
+                                  "help": "Specifies whether requests should be dispatched to any client, or automatically matched to the same client when possible [auto]."})
+}
+_socket_attribs.update(InputForceField.attribs)
+# the socket polling mechanism won't work with non-threaded execution
+_socket_attribs["threaded"] = (InputValue, {"dtype": bool,
+                                            "default": True,
+                                            "help": "Whether the forcefield should use a thread loop to evaluate, or work in serial. Should be set to True for FFSockets"})
+
+# the allowed ranges of the socket parameters, see InputForceField._check_ranges
+_socket_ranges = (("port", 1, 65535, "Port number {} out of acceptable range."),
+                  ("slots", 1, 5, "Slot number {} out of acceptable range."),
+                  ("latency", 0, None, "Negative latency parameter specified."),
+                  ("timeout", 0.0, None, "Negative timeout parameter specified."))
+
+# the socket interface arguments, as (keyword, field name), see InputForceField._socket_kwargs
+_socket_interface_kwargs = (("address", "address"), ("port", "port"), ("slots", "slots"), ("mode", "mode"),
+                            ("timeout", "timeout"), ("match_mode", "matching"),
+                            ("exit_on_disconnect", "exit_on_disconnect"))
+
+# the fields of the independent baths and of the partial charges, shared by the cavity forcefields
+_n_independent_bath_spec = (InputValue, {"dtype": int,
+                                         "default": 1,
+                                         "help": "Number of identical independent baths to accelerate ab initio calculations"})
+_n_qm_atom_help = "Number of atoms that are needed to be calculated by QM methods (-1 means all atoms are QM)"
+_mm_charge_array_spec = (InputArray, {"dtype": float,
+                                      "default": input_default(factory=np.zeros, args=(0,), kwargs={"dtype": float}),
+                                      "help": "The partial charges of the MM atoms, in the format [Q1, Q2, ... ].",
+                                      "dimension": "length"})
+_qm_charge_array_spec = (InputArray, {"dtype": float,
+                                      "default": input_default(factory=np.zeros, args=(0,), kwargs={"dtype": float}),
+                                      "help": "The partial charges of the QM atoms, in the format [Q1, Q2, ... ]. With this definition, dipole and its derivatives will not be computed",
+                                      "dimension": "length"})
+
+
 class InputFFSocket(InputForceField):
 
     """Creates a ForceField object with a socket interface.
@@ -110,39 +187,9 @@ class InputFFSocket(InputForceField):
           that the client code has died. If 0 there is no timeout.
     """
 
-    fields = {"address": (InputValue, {"dtype": str,
-                                       "default": "localhost",
-                                       "help": "This gives the server address that the socket will run on."}),
-              "port": (InputValue, {"dtype": int,
-                                    "default": 65535,
-                                    "help": "This gives the port number that defines the socket."}),
-              "slots": (InputValue, {"dtype": int,
-                                     "default": 4,
-                                     "help": "This gives the number of client codes that can queue at any one time."}),
-              "exit_on_disconnect": (InputValue, {"dtype": bool,
-                                                  "default": False,
-                                                  "help": "Determines if i-PI should quit when a client disconnects."}),
-              "timeout": (InputValue, {"dtype": float,
-                                       "default": 0.0,
-                                       "help": "This gives the number of seconds before assuming a calculation has died. If 0 there is no timeout."})}
-    attribs = {
-        "mode": (InputAttribute, {"dtype": str,
-                                  "options": ["unix", "inet"],
-                                  "default": "inet",
-                                  "help": "Specifies whether the driver interface will listen onto a internet socket [inet] or onto a unix socket [unix]."}),
-                "matching": (InputAttribute, {"dtype": str,
-                                              "options": ["auto", "any"],
-                                              "default": "auto",
-                                              "help": "Specifies whether requests should be dispatched to any client, or automatically matched to the same client when possible [auto]."})
-    }
-
-    attribs.update(InputForceField.attribs)
+    fields = dict(_socket_fields)
     fields.update(InputForceField.fields)
-
-    # FFSocket polling mechanism won't work with non-threaded execution
-    attribs["threaded"] = (InputValue, {"dtype": bool,
-                                        "default": True,
-                                        "help": "Whether the forcefield should use a thread loop to evaluate, or work in serial. Should be set to True for FFSockets"});
+    attribs = dict(_socket_attribs)
 
     default_help = "Deals with the assigning of force calculation jobs to different driver codes, and collecting the data, using a socket for the data communication."
     default_label = "FFSOCKET"
@@ -175,39 +222,28 @@ class InputFFSocket(InputForceField):
            A ForceSocket object with the correct socket parameters.
         """
 
-        if self.threaded.fetch() == False:
+        if not self.threaded.fetch():
             raise ValueError("FFSockets cannot poll without threaded mode.")
         # just use threaded throughout
         return FFSocket(pars=self.parameters.fetch(), name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(),
-                        active=self.activelist.fetch(), threaded=self.threaded.fetch(),
-                        interface=InterfaceSocket(address=self.address.fetch(), port=self.port.fetch(),
-                                                  slots=self.slots.fetch(), mode=self.mode.fetch(), timeout=self.timeout.fetch(),
-                                                  match_mode=self.matching.fetch(), exit_on_disconnect=self.exit_on_disconnect.fetch()))
+                        active=self.activelist.fetch(), threaded=True,
+                        interface=InterfaceSocket(**self._socket_kwargs()))
 
     def check(self):
         """Deals with optional parameters."""
 
         super(InputFFSocket, self).check()
-        if self.port.fetch() < 1 or self.port.fetch() > 65535:
-            raise ValueError("Port number " + str(self.port.fetch()) + " out of acceptable range.")
-        elif self.port.fetch() < 1025:
+        self._check_ranges(_socket_ranges)
+        if self.port.fetch() < 1025:
             warning("Low port number being used, this may interrupt important system processes.", verbosity.low)
 
-        if self.slots.fetch() < 1 or self.slots.fetch() > 5:
-            raise ValueError("Slot number " + str(self.slots.fetch()) + " out of acceptable range.")
-        if self.latency.fetch() < 0:
-            raise ValueError("Negative latency parameter specified.")
-        if self.timeout.fetch() < 0.0:
-            raise ValueError("Negative timeout parameter specified.")
-
 
 class InputFFLennardJones(InputForceField):
 
-    attribs = {}
-    attribs.update(InputForceField.attribs)
-
-    default_help = """Simple, internal LJ evaluator without cutoff, neighbour lists or minimal image convention.
-                   Expects standard LJ parameters, e.g. { eps: 0.1, sigma: 1.0 }. """
+    default_help = """Simple, internal LJ evaluator without minimal image convention.
+                   Expects standard LJ parameters, e.g. { eps: 0.1, sigma: 1.0 }. An optional
+                   cutoff radius can be given, e.g. { eps: 0.1, sigma: 1.0, rc: 5.0 }, in which
+                   case the interactions are truncated sharply and a cell list is used. """
     default_label = "FFLJ"
 
     def store(self, ff):
@@ -237,9 +273,6 @@ class InputFFDebye(InputForceField):
 
     fields.update(InputForceField.fields)
 
-    attribs = {}
-    attribs.update(InputForceField.attribs)
-
     default_help = """Harmonic energy calculator """
     default_label = "FFDEBYE"
 
@@ -266,9 +299,6 @@ class InputFFPlumed(InputForceField):
 
     }
 
-    attribs = {}
-
-    attribs.update(InputForceField.attribs)
     fields.update(InputForceField.fields)
 
     default_help = """ Direct PLUMED interface """
@@ -324,9 +354,6 @@ class InputFFYaff(InputForceField):
 
     fields.update(InputForceField.fields)
 
-    attribs = {}
-    attribs.update(InputForceField.attribs)
-
     default_help = """Uses a Yaff force field to compute the forces."""
     default_label = "FFYAFF"
 
@@ -353,24 +380,23 @@ class InputFFsGDML(InputForceField):
 
     fields = {
         "sGDML_model": (InputValue, {"dtype": str, "default": None, "help": "This gives the file name of the sGDML model."}),
+        "use_torch": (InputValue, {"dtype": bool, "default": False, "help": "Runs the sGDML predictions through PyTorch, on a GPU if available. Requires sGDML to be installed with its optional PyTorch dependency."}),
     }
 
     fields.update(InputForceField.fields)
 
-    attribs = {}
-    attribs.update(InputForceField.attribs)
-
     default_help = """A SGDML energy calculator """
     default_label = "FFsGDML"
 
     def store(self, ff):
         super(InputFFsGDML, self).store(ff)
         self.sGDML_model.store(ff.sGDML_model)
+        self.use_torch.store(ff.use_torch)
 
     def fetch(self):
         super(InputFFsGDML, self).fetch()
 
-        return FFsGDML(sGDML_model=self.sGDML_model.fetch(), name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(), threaded=self.threaded.fetch())
+        return FFsGDML(sGDML_model=self.sGDML_model.fetch(), name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(), threaded=self.threaded.fetch(), use_torch=self.use_torch.fetch())
 
 class InputFFCavPhSocket(InputForceField):
 
@@ -390,41 +416,11 @@ class InputFFCavPhSocket(InputForceField):
           that the client code has died. If 0 there is no timeout.
     """
 
-    fields = {"address": (InputValue, {"dtype": str,
-                                       "default": "localhost",
-                                       "help": "This gives the server address that the socket will run on."}),
-              "port": (InputValue, {"dtype": int,
-                                    "default": 65535,
-                                    "help": "This gives the port number that defines the socket."}),
-              "slots": (InputValue, {"dtype": int,
-                                     "default": 4,
-                                     "help": "This gives the number of client codes that can queue at any one time."}),
-              "exit_on_disconnect": (InputValue, {"dtype": bool,
-                                                  "default": False,
-                                                  "help": "Determines if i-PI should quit when a client disconnects."}),
-              "timeout": (InputValue, {"dtype": float,
-                                       "default": 0.0,
-                                       "help": "This gives the number of seconds before assuming a calculation has died. If 0 there is no timeout."})}
-    attribs = {
-        "mode": (InputAttribute, {"dtype": str,
-                                  "options": ["unix", "inet"],
-                                  "default": "inet",
-                                  "help": "Specifies whether the driver interface will listen onto a internet socket [inet] or onto a unix socket [unix]."}),
-                "matching": (InputAttribute, {"dtype": str,
-                                              "options": ["auto", "any"],
-                                              "default": "auto",
-                                              "help": "Specifies whether requests should be dispatched to any client, or automatically matched to the same client when possible [auto]."})
-    }
-
-    attribs.update(InputForceField.attribs)
+    fields = dict(_socket_fields)
     fields.update(InputForceField.fields)
+    attribs = dict(_socket_attribs)
 
-    # FFCavPhSocket polling mechanism won't work with non-threaded execution
-    attribs["threaded"] = (InputValue, {"dtype": bool,
-                                        "default": True,
-                                        "help": "Whether the forcefield should use a thread loop to evaluate, or work in serial. Should be set to True for FFSockets"});
-
-    default_help = "Deals with the assigning of force calculation jobs to different driver codes, and collecting the data, using a socket for the data communication."
+    default_help = InputFFSocket.default_help
     default_label = "FFCavPhSocket"
 
     def store(self, ff):
@@ -455,31 +451,21 @@ class InputFFCavPhSocket(InputForceField):
            A ForceSocket object with the correct socket parameters.
         """
 
-        if self.threaded.fetch() == False:
+        if not self.threaded.fetch():
             raise ValueError("FFCavPhSockets cannot poll without threaded mode.")
         # just use threaded throughout
         return FFCavPhSocket(pars=self.parameters.fetch(), name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(),
-                        active=self.activelist.fetch(), threaded=self.threaded.fetch(),
-                        interface=InterfaceCavPhSocket(address=self.address.fetch(), port=self.port.fetch(),
-                                                  slots=self.slots.fetch(), mode=self.mode.fetch(), timeout=self.timeout.fetch(),
-                                                  match_mode=self.matching.fetch(), exit_on_disconnect=self.exit_on_disconnect.fetch()))
+                        active=self.activelist.fetch(), threaded=True,
+                        interface=InterfaceCavPhSocket(**self._socket_kwargs()))
 
     def check(self):
         """Deals with optional parameters."""
 
         super(InputFFCavPhSocket, self).check()
-        if self.port.fetch() < 1 or self.port.fetch() > 65535:
-            raise ValueError("Port number " + str(self.port.fetch()) + " out of acceptable range.")
-        elif self.port.fetch() < 1025:
+        self._check_ranges(_socket_ranges)
+        if self.port.fetch() < 1025:
             warning("Low port number being used, this may interrupt important system processes.", verbosity.low)
 
-        if self.slots.fetch() < 1 or self.slots.fetch() > 5:
-            raise ValueError("Slot number " + str(self.slots.fetch()) + " out of acceptable range.")
-        if self.latency.fetch() < 0:
-            raise ValueError("Negative latency parameter specified.")
-        if self.timeout.fetch() < 0.0:
-            raise ValueError("Negative timeout parameter specified.")
-
 class InputFFCavPhFPSocket(InputForceField):
 
     """Creates a ForceField object with a socket interface.
@@ -498,37 +484,19 @@ class InputFFCavPhFPSocket(InputForceField):
           that the client code has died. If 0 there is no timeout.
     """
 
-    fields = {"address": (InputValue, {"dtype": str,
-                                       "default": "localhost",
-                                       "help": "This gives the server address that the socket will run on."}),
-              "port": (InputValue, {"dtype": int,
-                                    "default": 65535,
-                                    "help": "This gives the port number that defines the socket."}),
-              "slots": (InputValue, {"dtype": int,
-                                     "default": 4,
-                                     "help": "This gives the number of client codes that can queue at any one time."}),
-              "exit_on_disconnect": (InputValue, {"dtype": bool,
-                                                  "default": False,
-                                                  "help": "Determines if i-PI should quit when a client disconnects."}),
-              "timeout": (InputValue, {"dtype": float,
-                                       "default": 0.0,
-                                       "help": "This gives the number of seconds before assuming a calculation has died. If 0 there is no timeout."}),
-              "n_independent_bath": (InputValue, {"dtype": int,
-                                          "default": 1,
-                                          "help": "Number of identical independent baths to accelerate ab initio calculations"}),
+    fields = dict(_socket_fields)
+    fields.update({
+              "n_independent_bath": _n_independent_bath_spec,
+              "batched_request": (InputValue, {"dtype": bool,
+                                               "default": False,
+                                               "help": "Sends all the independent baths to the client as a single request. Only use with drivers that treat the baths as independent replicas themselves."}),
               "n_qm_atom": (InputValue, {"dtype": int,
                                           "default": 0,
-                                          "help": "Number of atoms that are needed to be calculated by QM methods (-1 means all atoms are QM)"}),
-              "mm_charge_array": (InputArray, {"dtype": float,
-                                 "default": input_default(factory=np.zeros, args=(0,)),
-                                 "help": "The partial charges of the MM atoms, in the format [Q1, Q2, ... ].",
-                                 "dimension": "length"}),
-              "qm_charge_array": (InputArray, {"dtype": float,
-                               "default": input_default(factory=np.zeros, args=(0,)),
-                               "help": "The partial charges of the QM atoms, in the format [Q1, Q2, ... ]. With this definition, dipole and its derivatives will not be computed",
-                               "dimension": "length"}),
+                                          "help": _n_qm_atom_help}),
+              "mm_charge_array": _mm_charge_array_spec,
+              "qm_charge_array": _qm_charge_array_spec,
               "charge_array": (InputArray, {"dtype": float,
-                               "default": input_default(factory=np.zeros, args=(0,)),
+                               "default": input_default(factory=np.zeros, args=(0,), kwargs={"dtype": float}),
                                "help": "The partial charges of all the atoms, in the format [Q1, Q2, ... ]. With this definition, QM dipole and its derivatives will not be computed",
                                "dimension": "length"}),        
               "apply_photon": (InputValue, {"dtype": bool,
@@ -553,11 +521,11 @@ class InputFFCavPhFPSocket(InputForceField):
                                   "default": 1,
                                   "help": "number of k_parallel cavity modes in the y direction"}),  
               "x_grid_1d": (InputArray, {"dtype": float,
-                               "default": np.array([0.25]),
+                               "default": input_default(factory=np.full, args=(1, 0.25), kwargs={"dtype": float}),
                                "help": "molecular grid along x dimension in units of Lx",
                                "dimension": "length"}), 
               "y_grid_1d": (InputArray, {"dtype": float,
-                               "default": np.array([0.25]),
+                               "default": input_default(factory=np.full, args=(1, 0.25), kwargs={"dtype": float}),
                                "help": "molecular grid along y dimension in units of Ly",
                                "dimension": "length"}), 
               "ph_constraint": (InputValue, {"dtype": str,
@@ -566,29 +534,22 @@ class InputFFCavPhFPSocket(InputForceField):
               "ph_rep": (InputValue, {"dtype": str,
                                        "default": "loose",
                                        "help": "option: loose | dense, dofferent representations of ph coordinates"}),
-            }
-    attribs = {
-        "mode": (InputAttribute, {"dtype": str,
-                                  "options": ["unix", "inet"],
-                                  "default": "inet",
-                                  "help": "Specifies whether the driver interface will listen onto a internet socket [inet] or onto a unix socket [unix]."}),
-                "matching": (InputAttribute, {"dtype": str,
-                                              "options": ["auto", "any"],
-                                              "default": "auto",
-                                              "help": "Specifies whether requests should be dispatched to any client, or automatically matched to the same client when possible [auto]."})
-    }
-
-    attribs.update(InputForceField.attribs)
+              "ph_precision": (InputValue, {"dtype": str,
+                                            "options": ["double", "single"],
+                                            "default": "double",
+                                            "help": "Precision of the stored cavity mode functions and of the products with them. Single precision halves the memory traffic for large numbers of modes and grid points."}),
+            })
     fields.update(InputForceField.fields)
+    attribs = dict(_socket_attribs)
 
-    # FFCav2DPhSocket polling mechanism won't work with non-threaded execution
-    attribs["threaded"] = (InputValue, {"dtype": bool,
-                                        "default": True,
-                                        "help": "Whether the forcefield should use a thread loop to evaluate, or work in serial. Should be set to True for FFSockets"});
-
-    default_help = "Deals with the assigning of force calculation jobs to different driver codes, and collecting the data, using a socket for the data communication."
+    default_help = InputFFSocket.default_help
     default_label = "FFCavPhFPSocket"
 
+    # the fields that are stored and passed to FFCavPhFPSocket under their own name
+    _ff_kwargs = ("n_independent_bath", "batched_request", "n_qm_atom", "mm_charge_array", "qm_charge_array",
+                  "charge_array", "apply_photon", "E0", "omega_c_cminv", "domega_x_cminv", "domega_y_cminv",
+                  "n_mode_x", "n_mode_y", "x_grid_1d", "y_grid_1d", "ph_constraint", "ph_rep", "ph_precision")
+
     def store(self, ff):
         """Takes a ForceField instance and stores a minimal representation of it.
 
@@ -609,22 +570,8 @@ class InputFFCavPhFPSocket(InputForceField):
         self.matching.store(ff.socket.match_mode)
         self.exit_on_disconnect.store(ff.socket.exit_on_disconnect)
         self.threaded.store(True)  # hard-coded
-        self.n_independent_bath.store(ff.n_independent_bath)
-        self.n_qm_atom.store(ff.n_qm_atom)
-        self.mm_charge_array.store(ff.mm_charge_array)
-        self.qm_charge_array.store(ff.qm_charge_array)
-        self.charge_array.store(ff.charge_array)
-        self.apply_photon.store(ff.apply_photon) 
-        self.E0.store(ff.E0)
-        self.omega_c_cminv.store(ff.omega_c_cminv)
-        self.domega_x_cminv.store(ff.domega_x_cminv)
-        self.domega_y_cminv.store(ff.domega_y_cminv)
-        self.n_mode_x.store(ff.n_mode_x)
-        self.n_mode_y.store(ff.n_mode_y)
-        self.x_grid_1d.store(ff.x_grid_1d)
-        self.y_grid_1d.store(ff.y_grid_1d)
-        self.ph_constraint.store(ff.ph_constraint)
-        self.ph_rep.store(ff.ph_rep)
+        for k in self._ff_kwargs:
+            self.__dict__[k].store(getattr(ff, k))
 
     def fetch(self):
         """Creates a ForceSocket object.
@@ -633,40 +580,23 @@ class InputFFCavPhFPSocket(InputForceField):
            A ForceSocket object with the correct socket parameters.
         """
 
-        if self.threaded.fetch() == False:
+        if not self.threaded.fetch():
             raise ValueError("FFCavPhFPSockets cannot poll without threaded mode.")
+        kwargs = {k: self.__dict__[k].fetch() for k in self._ff_kwargs}
         # just use threaded throughout
         return FFCavPhFPSocket(pars=self.parameters.fetch(), name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(),
-                        active=self.activelist.fetch(), threaded=self.threaded.fetch(),
-                        interface=InterfaceSocket(address=self.address.fetch(), port=self.port.fetch(),
-                                                  slots=self.slots.fetch(), mode=self.mode.fetch(), timeout=self.timeout.fetch(),
-                                                  match_mode=self.matching.fetch(), exit_on_disconnect=self.exit_on_disconnect.fetch()),
-                        n_independent_bath=self.n_independent_bath.fetch(),
-                        n_qm_atom=self.n_qm_atom.fetch(),
-                        mm_charge_array=self.mm_charge_array.fetch(),
-                        qm_charge_array=self.qm_charge_array.fetch(),
-                        charge_array=self.charge_array.fetch(),
-                        apply_photon=self.apply_photon.fetch(), E0=self.E0.fetch(), omega_c_cminv=self.omega_c_cminv.fetch(), 
-                        domega_x_cminv=self.domega_x_cminv.fetch(), domega_y_cminv=self.domega_y_cminv.fetch(), 
-                        n_mode_x=self.n_mode_x.fetch(), n_mode_y=self.n_mode_y.fetch(), x_grid_1d=self.x_grid_1d.fetch(), 
-                        y_grid_1d=self.y_grid_1d.fetch(), ph_constraint=self.ph_constraint.fetch(), ph_rep=self.ph_rep.fetch())
+                        active=self.activelist.fetch(), threaded=True,
+                        interface=InterfaceSocket(**self._socket_kwargs()),
+                        **kwargs)
 
     def check(self):
         """Deals with optional parameters."""
 
         super(InputFFCavPhFPSocket, self).check()
-        if self.port.fetch() < 1 or self.port.fetch() > 65535:
-            raise ValueError("Port number " + str(self.port.fetch()) + " out of acceptable range.")
-        elif self.port.fetch() < 1025:
+        self._check_ranges(_socket_ranges)
+        if self.port.fetch() < 1025:
             warning("Low port number being used, this may interrupt important system processes.", verbosity.low)
 
-        if self.slots.fetch() < 1 or self.slots.fetch() > 5:
-            raise ValueError("Slot number " + str(self.slots.fetch()) + " out of acceptable range.")
-        if self.latency.fetch() < 0:
-            raise ValueError("Negative latency parameter specified.")
-        if self.timeout.fetch() < 0.0:
-            raise ValueError("Negative timeout parameter specified.")
-
 class InputFFCavPh(InputForceField):
 
     fields = {"input_xyz_filename": (InputValue, {"dtype": str,
@@ -690,63 +620,41 @@ class InputFFCavPh(InputForceField):
               "nthread": (InputValue, {"dtype": int,
                                           "default": 1,
                                           "help": "Number of threads used for PSI4 calculation"}),
-              "n_independent_bath": (InputValue, {"dtype": int,
-                                          "default": 1,
-                                          "help": "Number of identical independent baths to accelerate ab initio calculations"}),
+              "n_independent_bath": _n_independent_bath_spec,
               "n_qm_atom": (InputValue, {"dtype": int,
                                           "default": -1,
-                                          "help": "Number of atoms that are needed to be calculated by QM methods (-1 means all atoms are QM)"}),
-              "mm_charge_array": (InputArray, {"dtype": float,
-                                 "default": input_default(factory=np.zeros, args=(0,)),
-                                 "help": "The partial charges of the MM atoms, in the format [Q1, Q2, ... ].",
-                                 "dimension": "length"}),
-              "qm_charge_array": (InputArray, {"dtype": float,
-                               "default": input_default(factory=np.zeros, args=(0,)),
-                               "help": "The partial charges of the QM atoms, in the format [Q1, Q2, ... ]. With this definition, dipole and its derivatives will not be computed",
-                               "dimension": "length"}),
+                                          "help": _n_qm_atom_help}),
+              "mm_charge_array": _mm_charge_array_spec,
+              "qm_charge_array": _qm_charge_array_spec,
+              "binary_geometry": (InputValue, {"dtype": bool,
+                                          "default": False,
+                                          "help": "Pass the geometry of each bath to the run_qc_driver scripts as the path of a binary file, IPI_DRIVER_TEMP_n/geom.bin, holding the x y z coordinates as float64. The atomic labels are written once to IPI_DRIVER_TEMP_n/labels"}),
+              "persistent_drivers": (InputValue, {"dtype": bool,
+                                          "default": False,
+                                          "help": "Keep one run_qc_driver script per bath running between steps, started as './name persistent IPI_DRIVER_TEMP_n', instead of starting new ones at each step. At each step the script reads the number of arguments, then each argument as its number of lines followed by the lines, from its standard input, and prints one line when its output files are written"}),
     }
 
     fields.update(InputForceField.fields)
 
-    attribs = {}
-    attribs.update(InputForceField.attribs)
-
     default_help = """CavPh energy and gradients calculator """
     default_label = "FFCavPh"
 
+    # the fields that are stored and passed to FFCavPh under their own name
+    _ff_kwargs = ("input_xyz_filename", "grad_method", "output_file", "qchem_template", "memory_usage",
+                  "numpy_memory", "nthread", "n_independent_bath", "n_qm_atom", "mm_charge_array",
+                  "qm_charge_array", "binary_geometry", "persistent_drivers")
+
     def store(self, ff):
         if (not type(ff) is FFCavPh):
             raise TypeError("The type " + type(ff).__name__ + " is not a valid socket forcefield")
 
         super(InputFFCavPh, self).store(ff)
-        self.input_xyz_filename.store(ff.input_xyz_filename)
-        self.grad_method.store(ff.grad_method)
-        self.output_file.store(ff.output_file)
-        self.qchem_template.store(ff.qchem_template)
-        self.memory_usage.store(ff.memory_usage)
-        self.numpy_memory.store(ff.numpy_memory)
-        self.nthread.store(ff.nthread)
-        self.n_independent_bath.store(ff.n_independent_bath)
-        self.n_qm_atom.store(ff.n_qm_atom)
-        self.mm_charge_array.store(ff.mm_charge_array)
-        self.qm_charge_array.store(ff.qm_charge_array)
+        for k in self._ff_kwargs:
+            self.__dict__[k].store(getattr(ff, k))
 
     def fetch(self):
         super(InputFFCavPh, self).fetch()
 
-        return FFCavPh(input_xyz_filename=self.input_xyz_filename.fetch(),
-        grad_method=self.grad_method.fetch(),
-        output_file=self.output_file.fetch(),
-        qchem_template=self.qchem_template.fetch(),
-        memory_usage=self.memory_usage.fetch(),
-        numpy_memory=self.numpy_memory.fetch(),
-        nthread=self.nthread.fetch(),
-        name=self.name.fetch(),
-        latency=self.latency.fetch(),
-        dopbc=self.pbc.fetch(),
-        threaded=self.threaded.fetch(),
-        n_independent_bath=self.n_independent_bath.fetch(),
-        n_qm_atom=self.n_qm_atom.fetch(),
-        mm_charge_array=self.mm_charge_array.fetch(),
-        qm_charge_array=self.qm_charge_array.fetch()
-        )
+        kwargs = {k: self.__dict__[k].fetch() for k in self._ff_kwargs}
+        return FFCavPh(name=self.name.fetch(), latency=self.latency.fetch(), dopbc=self.pbc.fetch(),
+                       threaded=self.threaded.fetch(), **kwargs)
@@ -351,7 +351,7 @@ class Driver(DriverSocket):
         if self.apply_photon:
             self.pos_no_photon = self.pos[:-3*self.photons.nphoton]
             self.photons.update_pos(self.pos[-3*self.photons.nphoton:])
-            self.dipole.update_pos(self.pos_no_photon.copy())
+            self.dipole.update_pos(self.pos_no_photon)
         if self.dipole.nuclei_force_use_pbc:
             # Apply ABC to the pos_no_photon
             self.pos_no_photon = dstrip(self.pos_no_photon).copy()
@@ -465,23 +465,26 @@ class Driver(DriverSocket):
             mu += mu_photon + mu_int + 0.5 * self.photons.coeff_self * (dipole_x_tot**2 + dipole_y_tot**2)
 
             # 2. Modify nuclear force
-            mf[0::3] += - (Ex + self.photons.coeff_self * dipole_x_tot)  * dmudx
-            mf[1::3] += - (Ey + self.photons.coeff_self * dipole_y_tot)  * dmudy
+            mf3 = mf.reshape((-1, 3))
+            mf3[:, 0] -= (Ex + self.photons.coeff_self * dipole_x_tot) * dmudx
+            mf3[:, 1] -= (Ey + self.photons.coeff_self * dipole_y_tot) * dmudy
 
             # 3. Update if adding external electric fields
             self.dipole.add_pulse(mf)
             self.dipole.add_cw(mf)
 
-            # 4. Calculate photonic force
-            f_photon = self.photons.calc_photon_force(dipole_x_tot, dipole_y_tot)
+            # 4. Calculate photonic force, directly after the nuclear forces in
+            # the merged array
+            n_nuc = mf.size
+            mf_all = np.empty(n_nuc + self.photons.pos.size, np.float64)
+            mf_all[:n_nuc] = mf
+            mf = mf_all
+            f_photon = self.photons.calc_photon_force(dipole_x_tot, dipole_y_tot, out=mf[n_nuc:])
             # 4.1. Update if adding external electric fields on the photonic DoFs
             self.photons.add_pulse(f_photon)
             # copy the phase information from dipole
             self.photons.add_cw(f_photon, phase=self.dipole.get_cw_phase())
 
-            # 5. Merge the two forces
-            mf = np.concatenate((mf[:], f_photon[:]))
-
         return [mu, mf, mvir, mxtra]
 
     def dispatch(self, r):
@@ -495,7 +498,8 @@ class Driver(DriverSocket):
             warning(" @CavPhSOCKET:   Inconsistent client state in dispatch thread! (I)", verbosity.low)
             return
 
-        r["t_dispatched"] = time.time()
+        if r["profile"]:
+            r["t_dispatched"] = time.monotonic_ns()
 
         self.get_status()
         if self.status & Status.NeedsInit:
@@ -527,7 +531,8 @@ class Driver(DriverSocket):
         rftemp = r["result"][1]
         r["result"][1] = np.zeros(len(r["pos"]), dtype=np.float64)
         r["result"][1][r["active"]] = rftemp
-        r["t_finished"] = time.time()
+        if r["profile"]:
+            r["t_finished"] = time.monotonic_ns()
         self.lastreq = r["id"]  #
 
         # updates the status of the client before leaving
@@ -557,7 +562,7 @@ class InterfaceCavPhSocket(object):
           and dropping the connection.
        server: The socket used for data transmition.
        clients: A list of the driver clients connected to the server.
-       requests: A list of all the jobs required in the current PIMD step.
+       requests: The RequestQueue of all the jobs required in the current PIMD step.
        jobs: A list of all the jobs currently running.
        _poll_thread: The thread the poll loop is running on.
        _prev_kill: Holds the signals to be sent to clean up the main thread
@@ -698,8 +703,7 @@ class InterfaceCavPhSocket(object):
                     if j is c:
                         self.jobs = [w for w in self.jobs if not (w[0] is k and w[1] is j)]  # removes pair in a robust way
 
-                        k["status"] = "Queued"
-                        k["start"] = -1
+                        self.requests.requeue(k)
 
         if len(self.clients) == 0:
             searchtimeout = SERVERTIMEOUT
@@ -748,7 +752,7 @@ class InterfaceCavPhSocket(object):
 
         # fills up list of pending requests if empty, or if clients are abundant
         if len(self.prlist) == 0 or len(freec) > len(self.prlist):
-            self.prlist = [r for r in self.requests if r["status"] == "Queued"]
+            self.prlist = self.requests.queued()
 
         if self.match_mode == "auto":
             match_seq = ["match", "none", "free", "any"]
@@ -769,7 +773,7 @@ class InterfaceCavPhSocket(object):
                     if len(self.prlist) == 0:
                         break
             if len(freec) > 0:
-                self.prlist = [r for r in self.requests if r["status"] == "Queued"]
+                self.prlist = self.requests.queued()
         tdispatch += time.time()
 
         # now check for client status
@@ -11,13 +11,18 @@ import subprocess
 class dipole:
     def __init__(self):
         self.have_not_set = True
+        # (n,3) buffer of the nuclear positions, filled in place by update_pos
+        self.pos = None
+        # total dipole of the current positions and charges, see calc_dipole_tot
+        self._dipole_tot = None
         path = os.getcwd()
         self.run_photon = True
         try:
             with open(path+"/photon_params.json") as json_file:
                 data = json.load(json_file)
                 print("### Initialise dipole moments from photon_params.json ###")
-        except:
+        except IOError:
+            # a malformed photon_params.json is still reported by json.load
             self.run_photon = False
             print("Not found photon_params.json, do conventional nuclear dynamics")
         # Read necessary input from json_file
@@ -25,6 +30,13 @@ class dipole:
         # otherwise we assume that we do H2O simulation with partial charge defined
         # by q-tip4p-f force field
         self.not_have_charge_array = True
+        # defaults for conventional nuclear dynamics, so that the socket can
+        # query these options also when photon_params.json is not given
+        self.have_incoming_pulse = False
+        self.have_incoming_cw = False
+        self.update_charge = False
+        self.nuclei_force_use_pbc = True
+        self.print_charge = False
         if self.run_photon:
             if data.get("charge_array") is not None:
                 print("### Initialise charge array from file ###")
@@ -46,6 +58,9 @@ class dipole:
                 else:
                     self.pulse_params[2] *= 2.998e-5 * 2.0 * np.pi # unit converse from cm-1 to 2pi*fs-1
                     self.pulse_params[2] = np.array([self.pulse_params[2]])
+                # end of the pulse window and gaussian exponent, used at every step by add_pulse
+                self._pulse_t_end = self.pulse_params[4] + self.pulse_params[1]*4.0
+                self._pulse_inv_tau2 = 2.0 * np.log(2.0) / self.pulse_params[1]**2
                 # pulse_atoms = [1, 2, 3]
                 self.pulse_atoms = np.array(data.get("pulse_atoms", [0, 1, 2]), dtype=np.int32)
                 self.pulse_all_atoms = False
@@ -55,7 +70,7 @@ class dipole:
                 print(self.pulse_atoms)
                 # calculate the corresponding index in the force (correspond to the x axis)
                 # atom 1 atom 2 atom 3
-                self.pulse_atoms_force_index = np.array([x*3+self.add_pulse_direction for x in self.pulse_atoms])
+                self.pulse_atoms_force_index = self.pulse_atoms*3 + self.add_pulse_direction
                 self.t = data.get("t0", 0.0)
                 self.dt = data.get("dt", 0.5)
                 print("## add initial pulse with E0 %.2E at time %.2f for molecules ##" %(self.pulse_params[0], self.pulse_params[4]))
@@ -95,7 +110,7 @@ class dipole:
                 print(self.cw_atoms)
                 # calculate the corresponding index in the force (correspond to the x axis)
                 # atom 1 atom 2 atom 3
-                self.cw_atoms_force_index = np.array([x*3+self.add_cw_direction for x in self.cw_atoms])
+                self.cw_atoms_force_index = self.cw_atoms*3 + self.add_cw_direction
                 self.t = data.get("t0", 0.0)
                 self.dt = data.get("dt", 0.5)
             else:
@@ -115,11 +130,12 @@ class dipole:
     def add_pulse(self, mf):
         if self.have_incoming_pulse:
             self.t += self.dt
-            if self.t > self.pulse_params[4] and self.t < self.pulse_params[4] + self.pulse_params[1]*4.0:
+            if self.t > self.pulse_params[4] and self.t < self._pulse_t_end:
                 self.set_charges()
                 t = self.t - self.pulse_params[4] #- self.pulse_params[1]*4.0
-                Ex = np.sum(self.pulse_params[0] * np.exp(-t**2 / self.pulse_params[1]**2 \
-                    * 2.0 * np.log(2.0)) * np.sin(self.pulse_params[2]*self.t + self.pulse_params[3]))
+                # the envelope is the same for all the frequencies
+                Ex = self.pulse_params[0] * np.exp(-t**2 * self._pulse_inv_tau2) \
+                    * np.sum(np.sin(self.pulse_params[2]*self.t + self.pulse_params[3]))
                 mf[self.pulse_atoms_force_index] += Ex * self.charges[self.pulse_atoms]
 
     def add_cw(self, mf):
@@ -152,7 +168,7 @@ class dipole:
 
     def set_charges(self):
         if self.have_not_set:
-            self.charges = np.zeros(np.shape(self.pos[:,0]))
+            self.charges = np.zeros(self.pos.shape[0])
             if self.not_have_charge_array and not self.update_charge:
                 self.charges[0::3] = -0.8192 #-0.8472
                 self.charges[1::3] = 0.4096 #0.4236
@@ -167,11 +183,11 @@ class dipole:
             self.have_not_set = False
             # also change the atom array for pulse incoming
             if self.have_incoming_pulse and self.pulse_all_atoms:
-                self.pulse_atoms = np.array([n for n in range(np.size(self.pos[:,0]))])
-                self.pulse_atoms_force_index = np.array([x*3+self.add_pulse_direction for x in self.pulse_atoms])
+                self.pulse_atoms = np.arange(self.pos.shape[0], dtype=np.int32)
+                self.pulse_atoms_force_index = self.pulse_atoms*3 + self.add_pulse_direction
             if self.have_incoming_cw and self.cw_all_atoms:
-                self.cw_atoms = np.array([n for n in range(np.size(self.pos[:,0]))])
-                self.cw_atoms_force_index = np.array([x*3+self.add_cw_direction for x in self.cw_atoms])
+                self.cw_atoms = np.arange(self.pos.shape[0], dtype=np.int32)
+                self.cw_atoms_force_index = self.cw_atoms*3 + self.add_cw_direction
 
     def update_charges(self, charge_array):
         '''
@@ -179,16 +195,22 @@ class dipole:
         '''
         if self.update_charge:
             # check the size of charge_array
-            nat = np.size(self.pos[:,0])
+            nat = self.pos.shape[0]
             if nat == np.size(charge_array):
                 self.charges = charge_array
+                self._dipole_tot = None
             else:
                 print("#### Obtained charge_array has wrong size ####")
                 exit(1)
 
     def update_pos(self, pos):
         # this function is the very first function i-pi called after initialization
-        self.pos = np.reshape(pos, (-1, 3))
+        # the positions are copied in the same buffer at every step
+        pos = np.reshape(pos, (-1, 3))
+        if self.pos is None or self.pos.shape != pos.shape:
+            self.pos = np.empty(pos.shape)
+        self.pos[:] = pos
+        self._dipole_tot = None
         # Boundary condition
 
 
@@ -197,60 +219,63 @@ class dipole:
         self.set_charges()
         return self.charges * self.pos[:,0]
 
+    def calc_dipole_tot(self):
+        "calculate the total molecular dipole, computed once for each set of positions and charges"
+        if self._dipole_tot is None:
+            self.set_charges()
+            self._dipole_tot = np.dot(self.charges, self.pos)
+        return self._dipole_tot
+
     def calc_dipoles_x_tot(self):
         "calculate the total value of the x_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges * self.pos[:,0])
+        return self.calc_dipole_tot()[0]
 
     def calc_dipoles_y_tot(self):
         "calculate the total value of the y_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges * self.pos[:,1])
+        return self.calc_dipole_tot()[1]
 
     def calc_dipoles_z_tot(self):
         "calculate the total value of the z_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges * self.pos[:,2])
+        return self.calc_dipole_tot()[2]
 
     def calc_dipoles_tot_array(self):
+        return self.calc_dipole_tot().reshape((1, 3))
+
+    def calc_dipole_which(self, i=0):
+        "calculate the dipole of the i-th (three-atom) molecule"
         self.set_charges()
-        return np.reshape(np.array([self.calc_dipoles_x_tot(), self.calc_dipoles_y_tot(), self.calc_dipoles_z_tot()]), (1,3))
+        return np.dot(self.charges[i*3:i*3+3], self.pos[i*3:i*3+3])
 
     def calc_dipoles_x_which(self, i=0):
-        "calculate the total value of the x_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges[i*3:i*3+3] * self.pos[i*3:i*3+3,0])
+        "calculate the x_component of the dipole of the i-th molecule"
+        return self.calc_dipole_which(i)[0]
 
     def calc_dipoles_y_which(self, i=0):
-        "calculate the total value of the y_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges[i*3:i*3+3] * self.pos[i*3:i*3+3,1])
+        "calculate the y_component of the dipole of the i-th molecule"
+        return self.calc_dipole_which(i)[1]
 
     def calc_dipoles_z_which(self, i=0):
-        "calculate the total value of the z_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges[i*3:i*3+3] * self.pos[i*3:i*3+3,2])
-
-    def calc_dipoles_x_which(self, index=0):
-        "calculate the total value of the x_component of the molecular dipole"
-        self.set_charges()
-        return np.sum(self.charges[index*3:index*3+3] * self.pos[index*3:index*3+3, 0])
+        "calculate the z_component of the dipole of the i-th molecule"
+        return self.calc_dipole_which(i)[2]
 
     def calc_dmudx(self):
         "calculate the spatial derivative of the molecular dipole"
+        self.set_charges()
         return self.charges
 
     def calc_dmudy(self):
         "calculate the spatial derivative of the molecular dipole"
+        self.set_charges()
         return self.charges
 
     def calc_self_dipole_energy(self, pos):
+        self.set_charges()
         return self.charges * self.pos[:,0]
 
     def calc_dipole_x_y_and_derivatives(self):
-        self.set_charges()
-        dipole_x_tot = np.sum(self.charges * self.pos[:,0])
-        dipole_y_tot = np.sum(self.charges * self.pos[:,1])
+        # one pass over the (n,3) positions gives all the components, and
+        # the z component is reused by calc_dipoles_z_tot
+        dipole_x_tot, dipole_y_tot = self.calc_dipole_tot()[:2]
         dmudx = self.charges
         dmudy = self.charges
         # option for print charges
@@ -82,7 +82,7 @@ class photons:
             self.pos = np.zeros(self.nphoton*3, np.float64)
             self.coeff_self = np.sum(self.E0_lst[0:self.nmodes]**2 / self.mass / self.freq_lst[0:self.nmodes]**2)
             self.pot_coeff = 0.5 * self.mass * self.freq_lst**2
-            self.pot_coeff2 = self.mass * np.reshape(np.array([[x,x,x] for x in self.freq_lst]), -1)**2
+            self.pot_coeff2 = self.mass * np.repeat(self.freq_lst, 3)**2
             # Find if photon_params.json has defined an incoming pulse at initial times
             self.have_incoming_pulse = data.get("add_pulse_photon", False)
             self.have_incoming_cw = data.get("add_cw_photon", False)
@@ -207,13 +207,15 @@ class photons:
         return np.sum(self.pot_coeff2 * self.pos**2) / 2.0
 
     def obtain_Ex(self):
-        return np.sum(self.E0_lst[0:self.nmodes] * self.pos[0:self.nmodes*3:3])
+        return np.dot(self.E0_lst[0:self.nmodes], self.pos[0:self.nmodes*3:3])
 
     def obtain_Ey(self):
-        return np.sum(self.E0_lst[self.nmodes:] * self.pos[self.nmodes*3+1::3])
+        return np.dot(self.E0_lst[self.nmodes:], self.pos[self.nmodes*3+1::3])
 
-    def calc_photon_force(self, mu_x, mu_y):
-        f = - self.pot_coeff2 * self.pos
+    def calc_photon_force(self, mu_x, mu_y, out=None):
+        # the forces can be written in a given array, e.g. the tail of the total forces
+        f = np.multiply(self.pot_coeff2, self.pos, out=out)
+        np.negative(f, out=f)
         f[0:self.nmodes*3:3] -= mu_x * self.E0_lst[0:self.nmodes]
         f[self.nmodes*3+1::3] -=  mu_y * self.E0_lst[self.nmodes:]
         return f
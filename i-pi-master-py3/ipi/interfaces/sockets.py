@@ -429,7 +429,8 @@ class Driver(DriverSocket):
             )
             return
 
-        r["t_dispatched"] = time.time()
+        if r["profile"]:
+            r["t_dispatched"] = time.monotonic_ns()
 
         self.get_status()
         if self.status & Status.NeedsInit:
@@ -467,7 +468,8 @@ class Driver(DriverSocket):
         rftemp = r["result"][1]
         r["result"][1] = np.zeros(len(r["pos"]), dtype=np.float64)
         r["result"][1][r["active"]] = rftemp
-        r["t_finished"] = time.time()
+        if r["profile"]:
+            r["t_finished"] = time.monotonic_ns()
         self.lastreq = r["id"]  #
 
         # updates the status of the client before leaving
@@ -497,7 +499,7 @@ class InterfaceSocket(object):
           and dropping the connection.
        server: The socket used for data transmition.
        clients: A list of the driver clients connected to the server.
-       requests: A list of all the jobs required in the current PIMD step.
+       requests: The RequestQueue of all the jobs required in the current PIMD step.
        jobs: A list of all the jobs currently running.
        _poll_thread: The thread the poll loop is running on.
        _prev_kill: Holds the signals to be sent to clean up the main thread
@@ -675,8 +677,7 @@ class InterfaceSocket(object):
                             w for w in self.jobs if not (w[0] is k and w[1] is j)
                         ]  # removes pair in a robust way
 
-                        k["status"] = "Queued"
-                        k["start"] = -1
+                        self.requests.requeue(k)
 
         if len(self.clients) == 0:
             searchtimeout = SERVERTIMEOUT
@@ -738,7 +739,7 @@ class InterfaceSocket(object):
 
         # fills up list of pending requests if empty, or if clients are abundant
         if len(self.prlist) == 0 or len(freec) > len(self.prlist):
-            self.prlist = [r for r in self.requests if r["status"] == "Queued"]
+            self.prlist = self.requests.queued()
 
         if self.match_mode == "auto":
             match_seq = ["match", "none", "free", "any"]
@@ -759,7 +760,7 @@ class InterfaceSocket(object):
                     if len(self.prlist) == 0:
                         break
             if len(freec) > 0:
-                self.prlist = [r for r in self.requests if r["status"] == "Queued"]
+                self.prlist = self.requests.queued()
         tdispatch += time.time()
 
         # now check for client status
@@ -18,7 +18,6 @@ bad data types, and failure to input required fields.
 # See the "licenses" directory for full license information.
 
 
-from copy import copy
 
 import numpy as np
 
@@ -942,12 +941,12 @@ class InputArray(InputValue):
        shape: The shape of the array.
     """
 
-    attribs = copy(InputValue.attribs)
+    attribs = InputValue.attribs.copy()
     attribs["shape"] = (InputAttribute, {"dtype": tuple, "help": "The shape of the array.", "default": (0,)})
     attribs["mode"] = (InputAttribute, {"dtype": str,
                                         "default": "manual",
-                                        "options": ["manual", "file"],
-                                        "help": "If 'mode' is 'manual', then the array is read in directly, then reshaped according to the 'shape' specified in a row-major manner. If 'mode' is 'file' then the array is read in from the file given."})
+                                        "options": ["manual", "file", "npy"],
+                                        "help": "If 'mode' is 'manual', then the array is read in directly, then reshaped according to the 'shape' specified in a row-major manner. If 'mode' is 'file' then the array is read in from the text file given. If 'mode' is 'npy' then the array is read in from the binary NumPy .npy file given, which is much faster for large arrays."})
 
     def __init__(self, help=None, default=None, dtype=None, dimension=None):
         """Initialises InputArray.
@@ -971,7 +970,8 @@ class InputArray(InputValue):
               in.
         """
 
-        super(InputArray, self).store(value=np.array(value, dtype=self.type).flatten().copy(), units=units)
+        # flatten() always returns a new array, so the stored data is never a view of value
+        super(InputArray, self).store(value=np.asarray(value, dtype=self.type).flatten(), units=units)
         self.shape.store(value.shape)
 
         # if the shape is not specified, assume the array is linear.
@@ -987,7 +987,7 @@ class InputArray(InputValue):
 
         # if the shape is not specified, assume the array is linear.
         if self.shape.fetch() == (0,):
-            value = np.resize(value, 0).copy()
+            value = np.resize(value, 0)
         else:
             value = value.reshape(self.shape.fetch()).copy()
 
@@ -1045,6 +1045,9 @@ class InputArray(InputValue):
             self.value = read_array(self.type, self._text)
         elif mode == "file":
             self.value = np.loadtxt(self._text.strip(), comments="#", dtype=self.type).flatten()
+        elif mode == "npy":
+            # memory-maps the file, so only the single conversion to a flat array reads the data
+            self.value = np.asarray(np.load(self._text.strip(), mmap_mode="r"), dtype=self.type).flatten()
         else:
             raise ValueError("Unsupported array reading mode")
 
@@ -0,0 +1,237 @@
+"""Deals with testing the python force field evaluators."""
+
+# This file is part of i-PI.
+# i-PI Copyright (C) 2014-2015 i-PI developers
+# See the "licenses" directory for full license information.
+
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from ipi.engine.atoms import Atoms
+from ipi.engine.cell import Cell
+from ipi.engine.forcefields import FFLennardJones, FFDebye, RequestQueue
+from ipi.engine.forcefields import PhotonDriverFabryPerot, _read_table, _charge_dipder, _communicate_all
+
+
+def get_system(nat=12, seed=12345):
+    """Builds a small random cluster in a large box."""
+
+    prng = np.random.RandomState(seed)
+    atoms = Atoms(nat)
+    atoms.q = prng.uniform(0.0, 4.0, 3 * nat)
+    cell = Cell(np.eye(3) * 20.0)
+    return atoms, cell
+
+
+def lj_reference(q, eps, sigma, rc=np.inf):
+    """Naive double loop over pairs, used as a reference."""
+
+    q = q.reshape((-1, 3))
+    v = 0.0
+    f = np.zeros(q.shape)
+    for i in range(len(q)):
+        for j in range(i):
+            dij = q[i] - q[j]
+            rij2 = np.dot(dij, dij)
+            if rij2 >= rc * rc:
+                continue
+            x6 = (sigma**2 / rij2)**3
+            v += 4 * eps * (x6**2 - x6)
+            fij = 24 * eps * (2.0 * x6**2 - x6) / rij2 * dij
+            f[i] += fij
+            f[j] -= fij
+    return v, f.flatten()
+
+
+def test_lennard_jones():
+    """Tests FFLennardJones against a pair-by-pair evaluation."""
+
+    atoms, cell = get_system()
+    ff = FFLennardJones(pars={"eps": 0.1, "sigma": 1.2})
+    req = ff.queue(atoms, cell)
+    assert req["status"] == "Done"
+    assert req.wait(0.0)
+
+    v, f = lj_reference(atoms.q, 0.1, 1.2)
+    assert_allclose(req["result"][0], v, rtol=1e-10)
+    assert_allclose(req["result"][1], f, rtol=1e-10, atol=1e-12)
+
+    # large systems are evaluated in blocks of rows
+    ff._max_pairs = 10
+    req = ff.queue(atoms, cell)
+    assert_allclose(req["result"][0], v, rtol=1e-10)
+    assert_allclose(req["result"][1], f, rtol=1e-10, atol=1e-12)
+
+
+def test_lennard_jones_cutoff():
+    """Tests the cell list evaluation of FFLennardJones with a cutoff."""
+
+    atoms, cell = get_system(nat=60)
+    atoms.q *= 2.0
+    ff = FFLennardJones(pars={"eps": 0.1, "sigma": 1.2, "rc": 2.5})
+    req = ff.queue(atoms, cell)
+
+    v, f = lj_reference(atoms.q, 0.1, 1.2, 2.5)
+    assert_allclose(req["result"][0], v, rtol=1e-10)
+    assert_allclose(req["result"][1], f, rtol=1e-10, atol=1e-12)
+
+    # a few far away atoms leave the bounding box mostly empty
+    atoms.q[-9:] = [1e5, 0, 0, 0, 2e5, 0, 0, 0, 3e5]
+    req = ff.queue(atoms, cell)
+
+    v, f = lj_reference(atoms.q, 0.1, 1.2, 2.5)
+    assert_allclose(req["result"][0], v, rtol=1e-10)
+    assert_allclose(req["result"][1], f, rtol=1e-10, atol=1e-12)
+
+
+def test_debye():
+    """Tests FFDebye with a full rank and a low rank Hessian."""
+
+    atoms, cell = get_system()
+    n3 = len(atoms.q)
+    prng = np.random.RandomState(54321)
+    xref = prng.uniform(0.0, 4.0, n3)
+
+    for rank in [n3, 4]:
+        A = prng.uniform(-1.0, 1.0, (n3, rank))
+        H = np.dot(A, A.T)
+        ff = FFDebye(H=H, xref=xref, vref=0.1)
+        req = ff.queue(atoms, cell)
+        assert req["status"] == "Done"
+
+        d = atoms.q - xref
+        assert_allclose(req["result"][0], 0.1 + 0.5 * np.dot(d, np.dot(H, d)), rtol=1e-10)
+        assert_allclose(req["result"][1], -np.dot(H, d), rtol=1e-10, atol=1e-12)
+
+        # several beads evaluated at once give the same results
+        reqs = [{"pos": atoms.q + 0.1 * i} for i in range(3)]
+        ff.evaluate_batch(reqs)
+        for i, r in enumerate(reqs):
+            d = atoms.q + 0.1 * i - xref
+            assert r["status"] == "Done"
+            assert_allclose(r["result"][0], 0.1 + 0.5 * np.dot(d, np.dot(H, d)), rtol=1e-10)
+            assert_allclose(r["result"][1], -np.dot(H, d), rtol=1e-10, atol=1e-12)
+
+
+def test_request_queue():
+    """Tests that the request queue can be modified while iterating on it."""
+
+    queue = RequestQueue()
+    reqs = [{"id": i, "status": "Queued"} for i in range(4)]
+    queue.extend(reqs)
+    assert len(queue) == 4
+
+    reqs[1]["status"] = "Running"
+    assert queue.queued() == [reqs[0], reqs[2], reqs[3]]
+    queue.requeue(reqs[1])
+    assert len(queue.queued()) == 4
+
+    for r in queue:
+        queue.remove(r)
+    assert len(queue) == 0
+    assert reqs[0] not in queue
+
+    # removing a request that was already released is harmless
+    queue.remove(reqs[0])
+
+
+def test_photon_contribs():
+    """Tests the fused evaluation of the Fabry-Perot photonic terms."""
+
+    prng = np.random.RandomState(4321)
+    for rep in ["loose", "dense"]:
+        ph = PhotonDriverFabryPerot(E0=2e-4, n_mode_x=3, n_mode_y=2, ph_rep=rep,
+                                    x_grid_1d=np.array([0.1, 0.4, 0.7]),
+                                    y_grid_1d=np.array([0.2, 0.6]))
+        charges = prng.uniform(-0.5, 0.5, 4)
+        ph.split_atom_ph_coord(prng.uniform(0.0, 1.0, ph.n_grid * 12 + ph.n_photon_3))
+        dx = prng.uniform(-1.0, 1.0, ph.n_grid)
+        dy = prng.uniform(-1.0, 1.0, ph.n_grid)
+
+        e, f_ph, fx, fy = ph.compute_photon_contribs(dx, dy, charges)
+        fx_ref, fy_ref = ph.get_nuc_cav_forces(dx, dy, charges)
+        assert_allclose(e, ph.get_ph_energy(dx, dy), rtol=1e-12)
+        assert_allclose(f_ph, ph.get_ph_forces(dx, dy), rtol=1e-12)
+        assert_allclose(fx, fx_ref, rtol=1e-12)
+        assert_allclose(fy, fy_ref, rtol=1e-12)
+
+        # the photonic forces can be written in a given array
+        out = np.zeros(ph.n_photon_3)
+        assert ph.compute_photon_contribs(dx, dy, charges, out=out)[1] is out
+        assert_allclose(out, f_ph, rtol=1e-12)
+
+        # ...and the cavity forces added to the nuclear forces
+        f_nuc = np.ones(ph.n_grid * 12)
+        ph.compute_photon_contribs(dx, dy, charges, f_nuc=f_nuc)
+        assert_allclose(f_nuc[0::3], 1.0 + fx, rtol=1e-12)
+        assert_allclose(f_nuc[1::3], 1.0 + fy, rtol=1e-12)
+        assert_allclose(f_nuc[2::3], 1.0)
+
+        # single precision mode functions give the same results to ~1e-6
+        ph32 = PhotonDriverFabryPerot(E0=2e-4, n_mode_x=3, n_mode_y=2, ph_rep=rep,
+                                      x_grid_1d=np.array([0.1, 0.4, 0.7]),
+                                      y_grid_1d=np.array([0.2, 0.6]), precision="single")
+        ph32.split_atom_ph_coord(np.concatenate((np.zeros(ph.n_grid * 12), ph.pos_ph)))
+        e32, f_ph32, fx32, fy32 = ph32.compute_photon_contribs(dx, dy, charges)
+        assert ph32.ftilde_kx.dtype == np.float32
+        assert f_ph32.dtype == np.float64 and fx32.dtype == np.float64
+        assert_allclose(e32, e, rtol=1e-5)
+        assert_allclose(f_ph32, f_ph, rtol=1e-5, atol=1e-8)
+        assert_allclose(fx32, fx, rtol=1e-5, atol=1e-8)
+        assert_allclose(fy32, fy, rtol=1e-5, atol=1e-8)
+
+
+def test_read_table(tmp_path):
+    """Tests that driver output files are read as np.loadtxt does."""
+
+    for text in ["-1.25e+02\n", "1 2 3\n", "1\n2\n3\n", "1.5 2\n3 4\n5 6\n\n"]:
+        filename = str(tmp_path / "table.dat")
+        with open(filename, "w") as f:
+            f.write(text)
+        ref = np.loadtxt(filename)
+        data = _read_table(filename)
+        assert data.shape == ref.shape
+        assert_allclose(data, ref)
+
+    # ragged or partly written files are rejected
+    for text in ["1 2 3 4\n5 6\n", "1 2 3\n4 5\n", "1 2\n3 x\n"]:
+        with open(filename, "w") as f:
+            f.write(text)
+        with pytest.raises(ValueError):
+            np.loadtxt(filename)
+        with pytest.raises(ValueError):
+            _read_table(filename)
+
+
+def test_charge_dipder():
+    """Tests the dipole derivatives of fixed point charges."""
+
+    charges = np.array([0.4, -0.8, 0.4])
+    q = np.random.RandomState(7).uniform(-1.0, 1.0, 9)
+    dipder = _charge_dipder(charges)
+    assert dipder.shape == (9, 3)
+    assert not dipder.flags.writeable
+
+    # the dipole is linear in the positions, so the derivatives are exact
+    mu = np.dot(charges, q.reshape((-1, 3)))
+    dq = np.random.RandomState(8).uniform(-0.1, 0.1, 9)
+    assert_allclose(np.dot(charges, (q + dq).reshape((-1, 3))) - mu, np.dot(dq, dipder), atol=1e-14)
+
+
+def test_communicate_all():
+    """Tests that the errors of the driver threads reach the caller."""
+
+    class Driver(object):
+        def __init__(self, fail):
+            self.fail = fail
+
+        def communicate(self):
+            if self.fail:
+                raise RuntimeError("driver has exited")
+            return "done\n", None
+
+    assert _communicate_all([Driver(False), Driver(False)]) == [("done\n", None)] * 2
+    with pytest.raises(RuntimeError):
+        _communicate_all([Driver(False), Driver(True)])